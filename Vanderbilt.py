@@ -1,6 +1,5 @@
 import time
 
-import faceDetection
 from bayesianNetwork import BeliefNetwork
 from episode import Episode
 from robot import Robot
@@ -14,8 +13,12 @@ FisherFaces, you must provide methods to re-train the model with all the face sa
 
 
 class Vanderbilt:
-    def __init__(self, robot_ip="pepper.local", demo_number=6, mature=True, simulation=False, withUpdate=False):
-        if not simulation:
+    def __init__(self, robot_ip="pepper.local", demo_number=6, mature=True, simulation=False, withUpdate=False,
+                 robot=None, half_life=None, window=None, group_familiarization=False):
+        if robot is not None:
+            # An already initialized robot, e.g. a headless one
+            self.robot = robot
+        elif not simulation:
             self.robot = Robot(robot_ip)
             self.init_robot()
         else:
@@ -29,6 +32,12 @@ class Vanderbilt:
         self.mature = mature
         self.simulation = simulation
         self.withUpdate = withUpdate
+        # Forgetting of the informants' beliefs: exponential decay half-life or sliding window size, None to disable
+        self.half_life = half_life
+        self.window = window
+        self.verbose = True
+        # If True, the faces of all the informants are learned together, in a single capture
+        self.group_familiarization = group_familiarization
 
     # Initializes the robot to the standard, ready to start configuration
     def init_robot(self):
@@ -45,37 +54,37 @@ class Vanderbilt:
             return
         self.robot.say("I'm going to help you create the experimental setup.")
         self.robot.say("I'm going to stand up.")
-        time.sleep(1)
+        self.wait(1)
         self.robot.standup()
         self.robot.say("Now place me in position.")
-        time.sleep(5)
+        self.wait(5)
         self.robot.say("Now place the mat in front of me and put the sticker on the left.")
-        time.sleep(5)
+        self.wait(5)
         found = False
         while not found:
             found = self.robot.look_for_landmark('A')
             if not found:
                 self.robot.say("I can't see the sticker. Please reposition the mat")
-                time.sleep(2)
+                self.wait(2)
             else:
                 found_alt = self.robot.look_for_landmark('B')
                 if found_alt:
                     self.robot.say("I can see the sticker in position A when looking at B. Please reposition the mat.")
-                    time.sleep(2)
+                    self.wait(2)
                     found = False
         self.robot.say("Ok. Move the sticker to the right")
-        time.sleep(2)
+        self.wait(2)
         found = False
         while not found:
             found = self.robot.look_for_landmark('B')
             if not found:
                 self.robot.say("I can't see the sticker. Please replace the mat")
-                time.sleep(2)
+                self.wait(2)
             else:
                 found_alt = self.robot.look_for_landmark('B')
                 if found_alt:
                     self.robot.say("I can see the sticker in position B when looking at A. Please reposition the mat.")
-                    time.sleep(2)
+                    self.wait(2)
                     found = False
         self.robot.say("Perfect! Everything is ready.")
 
@@ -83,19 +92,25 @@ class Vanderbilt:
     def start(self):
         if self.simulation:
             print "[INFO] Simulation initialized. Please give your inputs surrounded by quotation marks."
-        faceDetection.prepare_workspace("captures")
+        # The face frames of this experiment go to a new capture archive; the previous ones are kept
+        self.robot.capture_archive.start_session()
+        # A new experiment starts with new informants, as the final CSV datasets are overwritten too. A log left by an
+        # experiment which did not end is kept aside, since its episodes were never saved in the CSV datasets
+        if self.robot.episode_log is not None and self.robot.episode_log.exists():
+            path = self.robot.episode_log.archive()
+            print "[WARNING] The previous experiment did not end: its episodes have been moved to " + path
         self.robot.look_forward()
         if not self.simulation:
             self.robot.animation_service.runTag("hello")
         self.robot.say("Hello, nice to meet you.")
         self.robot.say("My name is Pepper and I'm glad to welcome you to the Vanderbot experiment for "
                        "Trust and Theory of Mind in humanoid robots.")
-        time.sleep(1)
+        self.wait(1)
         self.robot.say("The experiment begins now")
-        time.sleep(2)
+        self.wait(2)
         self.robot.say("Familiarization Phase")
         self.familiarization()
-        time.sleep(2)
+        self.wait(2)
         self.robot.say("Decision Making Phase")
         repeat = "yes"
         while repeat == "yes":
@@ -103,7 +118,7 @@ class Vanderbilt:
             self.robot.say("Do you want to repeat? Yes or no.")
             repeat = self.robot.listen_for_words(["yes", "no"])
         self.robot.say("Ok then, let's continue with the experiment.")
-        time.sleep(2)
+        self.wait(2)
         self.robot.say("Belief Estimation Phase")
         repeat = "yes"
         while repeat == "yes":
@@ -137,26 +152,35 @@ class Vanderbilt:
                 self.robot.animation_service.runTag("affirmative")
         number_of_informants = string_to_int[word]
         # Face detection and dataset collection
+        if self.group_familiarization:
+            # All the informants sit side by side in front of the robot, numbered from its left
+            self.robot.say("Please all sit in front of me, side by side")
+            self.wait(2)
+            self.robot.acquire_group_examples(self.face_frames_captured, range(number_of_informants))
         for i in range(number_of_informants):
-            self.demonstration(i)
-            if i < number_of_informants - 1:
+            self.demonstration(i, acquire=not self.group_familiarization)
+            if i < number_of_informants - 1 and not self.group_familiarization:
                 self.robot.say("Please leave your place for informer number " + str(i+1))
-                time.sleep(10)
+                self.wait(10)
         # Face learning
         self.robot.face_learning()
 
     # Demonstration: the robot familiarizes with the informer's face and habits
-    def demonstration(self, informant_number):
+    # acquire=False when the face samples have already been collected, e.g. with the whole group
+    def demonstration(self, informant_number, acquire=True):
         # Gets face samples for future recognition
-        if not self.simulation:
-            self.robot.animation_service.runTag("show")
-        self.robot.acquire_examples(self.face_frames_captured, informant_number)
+        if acquire:
+            if not self.simulation:
+                self.robot.animation_service.runTag("show")
+            self.robot.acquire_examples(self.face_frames_captured, informant_number)
+        else:
+            self.robot.say("Informer number " + str(informant_number) + ", it's your turn")
         self.robot.say("We are starting a brief demonstration. I am going to ask you to tell me where "
                        "the sticker is. We are going to undertake " + str(self.demo_number) +
                        (" trial" if self.demo_number == 1 else " trials"))
         if not self.simulation:
             self.robot.animation_service.runTag("explain")
-        time.sleep(2)
+        self.wait(2)
         demo_result = []
         for i in range(self.demo_number):
             # demo_sample = [Xr, Yr, Xi, Yi]
@@ -184,12 +208,14 @@ class Vanderbilt:
                     demo_sample = [0, 0, 0, 0]
             demo_sample_episode = Episode(demo_sample, self.robot.get_and_inc_time())
             demo_result.append(demo_sample_episode)
+            self.robot.record_episode("Informer" + str(informant_number), demo_sample_episode)
             # Give experimenters the time to switch the sticker location
             if not self.simulation and i < self.demo_number - 1:
-                time.sleep(5)
+                self.wait(5)
         self.robot.say("Excellent, now I know you a little more. Thank you")
         # Creates the belief network for this informer
-        self.robot.beliefs.append(BeliefNetwork("Informer" + str(informant_number), demo_result))
+        self.robot.beliefs.append(BeliefNetwork("Informer" + str(informant_number), demo_result,
+                                                half_life=self.half_life, window=self.window))
 
     # Decision Making Phase
     def decision_making(self, withUpdate=True):
@@ -202,7 +228,8 @@ class Vanderbilt:
         # Decision making based on the belief network for that particular informant
         choice = self.robot.beliefs[informer].decision_making(hint)
         if self.simulation:
-            print "Robot decides to look at position: " + str(choice)
+            if self.verbose:
+                print "Robot decides to look at position: " + str(choice)
         else:
             self.robot.say("I'm thinking at where to look based on your suggestion...")
             self.robot.animation_service.runTag("think")
@@ -252,12 +279,16 @@ class Vanderbilt:
                 else:
                     new_data = [0, 0, 0, 0]
             new_episode = Episode(new_data, self.robot.get_and_inc_time())
+            symmetric_episode = new_episode.generate_symmetric()
             self.robot.beliefs[informer].update_belief(new_episode)
             # Add the symmetric espisode too (with the same time value)
-            self.robot.beliefs[informer].update_belief(new_episode.generate_symmetric())
+            self.robot.beliefs[informer].update_belief(symmetric_episode)
+            self.robot.record_episode(self.robot.beliefs[informer].name, new_episode)
+            self.robot.record_episode(self.robot.beliefs[informer].name, symmetric_episode)
         # Finally, resets the eye color just in case an animation modified it
         if not self.simulation:
             self.robot.set_led_color("white")
+        return choice, found
 
     # Belief Estimation Phase
     def belief_estimation(self):
@@ -275,7 +306,7 @@ class Vanderbilt:
             else:
                 self.robot.say("Where is the sticker? I can't find it. Please put it in place.")
                 # Give the experimenters time to replace the sticker
-                time.sleep(5)
+                self.wait(5)
         [informant_belief, informant_action] = self.robot.beliefs[informer].belief_estimation(side)
         if not self.simulation:
             self.robot.say("Let me think...")
@@ -284,6 +315,11 @@ class Vanderbilt:
         self.robot.say("I know the sticker is on the " + self.translate_side(side) + ".")
         self.robot.say("I believe you think the sticker is on the " + self.translate_side(informant_belief))
         self.robot.say("I also believe you would point " + self.translate_side(informant_action) + " to me.")
+        return [informant_belief, informant_action]
+
+    # Pauses the experiment, e.g. to give the experimenters time to act
+    def wait(self, seconds):
+        time.sleep(seconds)
 
     # Translates the robot's label for the sides in one suitable for the informer
     def translate_side(self, side):
@@ -292,6 +328,10 @@ class Vanderbilt:
     # Closing processes
     def end(self):
         self.robot.save_beliefs()
+        # The episodes are in the CSV datasets now: the crash-recovery log is not needed anymore
+        if self.robot.episode_log is not None:
+            self.robot.episode_log.reset()
+        self.robot.save_time()
         if not self.simulation:
             self.robot.set_face_tracking(False)
         self.robot.standup()
@@ -1,13 +1,24 @@
-import copy
 import os
 from math import log
-from random import randint, shuffle, choice
+from random import choice
 
-from bayesian.bbn import *
-from bayesian.utils import make_key
+import numpy as np
 
 from datasetParser import DatasetParser
-from episode import Episode
+from episode import Episode, LABELS, SYMMETRIC
+from episodeDataset import EpisodeDataset
+from tensorNetwork import TensorNetwork
+
+# The junction tree engine is optional and only needed to cross-check the results of the tensor engine
+try:
+    from bayesian.bbn import build_bbn
+    from bayesian.utils import make_key
+except ImportError:
+    build_bbn = None
+
+# Inference engines. "tensor": exact contraction of the CPTs with NumPy (default), "bbn": bayesian.bbn junction tree
+ENGINES = ["tensor", "bbn"]
+INFERENCE_ENGINE = "tensor"
 
 """
 This class models the Developmental Bayesian Model of Trust in Artificial Cognitive Systems (Patacchiola, 2016).
@@ -16,9 +27,16 @@ Methods include the generation of the Episodic Memory by importance filtering an
 
 
 class BeliefNetwork:
-    def __init__(self, name, dataset):
+    def __init__(self, name, dataset, engine=None, half_life=None, window=None, counts=None):
         self.name = name
-        self.dataset = DatasetParser(dataset)
+        # Forgetting, see DatasetParser: exponential decay half-life over Episode.time, or sliding window size
+        self.half_life = half_life
+        self.window = window
+        self.engine = INFERENCE_ENGINE if engine is None else engine
+        if self.engine not in ENGINES:
+            print "[ERROR] BeliefNetwork. Invalid inference engine: " + str(self.engine)
+            quit(-1)
+        self.dataset = DatasetParser(dataset, half_life, window, counts)
         self.parameters = self.dataset.estimate_bn_parameters()
         self.bn = None
         # truth_a :
@@ -31,6 +49,12 @@ class BeliefNetwork:
             'lie_b': 1.0     # sticker in B, informer said A
         }
         self.entropy = None
+        # Cache of the values derived from the parameters: key -> (version, value). The version changes every time the
+        # parameters or the pdf change, invalidating the whole cache
+        self.version = 0
+        self.cache = dict()
+        self.cache_hits = 0
+        self.cache_misses = 0
         # Post-initialization processes
         self.build()
         self.calculate_pdf()
@@ -72,8 +96,15 @@ class BeliefNetwork:
         table['bbb'] = self.parameters["Yr"][3][1]
         return table[make_key(informant_action, robot_belief, robot_action)]
 
-    # Constructs the bayesian belief network
+    # Constructs the bayesian belief network with the selected inference engine
     def build(self):
+        self.invalidate_cache()
+        if self.engine == "tensor":
+            self.bn = TensorNetwork(self.parameters, name=self.name)
+            return
+        if build_bbn is None:
+            print "[ERROR] BeliefNetwork.build: the bbn engine requires the bayesian package."
+            quit(-1)
         self.bn = build_bbn(
             self.f_informant_belief,
             self.f_robot_belief,
@@ -136,18 +167,37 @@ class BeliefNetwork:
             return predicted_behaviour
 
     # Updates in real-time the belief
-    def update_belief(self, new_data):
+    # The incremental mode adds the episode to the running count tables in constant time. The full mode re-estimates
+    # everything from the whole episode dataset and is kept for cross-checking purposes.
+    def update_belief(self, new_data, incremental=True):
         if isinstance(new_data, Episode):
-            previous_dataset = self.get_episode_dataset()
-            previous_dataset.append(new_data)   # "previous_dataset" is now updated with new data
-            self.dataset = DatasetParser(previous_dataset)
-            self.parameters = self.dataset.estimate_bn_parameters()
-            self.build()
+            if incremental:
+                self.dataset.add_episode(new_data)
+                self.set_parameters(self.dataset.normalize())
+            else:
+                previous_dataset = self.get_episode_dataset()
+                previous_dataset.append(new_data)   # "previous_dataset" is now updated with new data
+                population = self.dataset.population
+                index = self.dataset.population_index
+                self.dataset = DatasetParser(previous_dataset, self.half_life, self.window)
+                self.parameters = self.dataset.estimate_bn_parameters()
+                # Keeps the network a view of its population
+                if population is not None:
+                    population.bind(self.dataset, index)
+                self.build()
             self.calculate_pdf()
         else:
             print "[ERROR] update_belief: new data is not an Episode instance."
             quit(-1)
 
+    # Replaces the parameters of the network without rebuilding it
+    def set_parameters(self, parameters):
+        self.parameters = parameters
+        self.invalidate_cache()
+        # The bbn factor callbacks read the parameters at query time, while the tensor engine must be refreshed
+        if isinstance(self.bn, TensorNetwork):
+            self.bn.set_parameters(parameters)
+
     # Prints the network parameters
     def print_parameters(self):
         print self.name + "\n" + str(self.parameters)
@@ -160,11 +210,10 @@ class BeliefNetwork:
     # Creates a new BN used for episodic memory. Uses all the previous information collected
     @staticmethod
     def create_full_episodic_bn(bn_list, time):
-        dataset = []
+        dataset = EpisodeDataset()
         for bn in bn_list:
-            episode_list = bn.get_episode_dataset()
-            for episode in episode_list:
-                dataset.append(Episode(episode.raw_data, time))
+            dataset.extend(bn.get_episode_dataset())
+        dataset.times[:] = time
         episodic_bn = BeliefNetwork("Episodic", dataset)
         return episodic_bn
 
@@ -174,28 +223,37 @@ class BeliefNetwork:
             os.makedirs(path)
         self.dataset.save(path + self.name + ".csv")
 
-    # Calculates the probability distribution
+    # Calculates the probability distribution from the episode counts of the dataset
     def calculate_pdf(self):
-        n = len(self.dataset.episode_dataset) + 4   # The 4 factor compensates the initialization at 1 insted of 0
-        # Resets all the pdf values
-        self.pdf = self.pdf.fromkeys(self.pdf, 1.0)
-        for item in self.dataset.episode_dataset:
-            item = item.raw_data
-            if item == [1, 1, 1, 1]:
-                self.pdf['truth_a'] += 1.0
-            elif item == [0, 0, 0, 0]:
-                self.pdf['truth_b'] += 1.0
-            elif item == [0, 0, 0, 1]:
-                self.pdf['lie_a'] += 1.0
-            elif item == [1, 1, 1, 0]:
-                self.pdf['lie_b'] += 1.0
-            else:
-                print "[ERROR] invalid dataset item not counted: " + str(item)
-        for key in self.pdf:
-            self.pdf[key] /= n
+        n = self.dataset.pdf_counts.sum()     # Counts are initialized at 1 to compensate the zero occurrences
+        for i, label in enumerate(LABELS):
+            self.pdf[label] = self.dataset.pdf_counts[i] / n
+        self.invalidate_cache()
+
+    # Invalidates every cached value. Must be called whenever the parameters or the pdf change
+    def invalidate_cache(self):
+        self.version += 1
+
+    # Returns a cached value, computing it if it is missing or outdated
+    def cached(self, key, compute):
+        entry = self.cache.get(key)
+        if entry is not None and entry[0] == self.version:
+            self.cache_hits += 1
+            return entry[1]
+        self.cache_misses += 1
+        value = compute()
+        self.cache[key] = (self.version, value)
+        return value
+
+    # Cache hit / miss counters
+    def cache_statistics(self):
+        return {"hits": self.cache_hits, "misses": self.cache_misses, "version": self.version}
 
     # Calculates the information entrophy
     def get_entropy(self):
+        return self.cached("entropy", self.compute_entropy)
+
+    def compute_entropy(self):
         entropy = 0
         for key, Px in self.pdf.items():
             if Px != 0:
@@ -204,7 +262,8 @@ class BeliefNetwork:
 
     # Calculates the unlikelihood of an episode in terms of information theory
     def surprise(self, episode):
-        return log(1 / self.pdf[episode.get_label()], 2)
+        label = episode.get_label()
+        return self.cached(("surprise", label), lambda: log(1 / self.pdf[label], 2))
 
     # Distance between the episode's surprise value and the network's entropy
     def entropy_difference(self, episode):
@@ -213,68 +272,73 @@ class BeliefNetwork:
         surprise = self.surprise(episode)
         return round(abs(surprise - entropy), 1) / normalization_factor
 
+    # Distance between the surprise value of each episode code and the network's entropy
+    def entropy_differences(self):
+        return self.cached("entropy_differences", lambda: np.array(
+            [self.entropy_difference(Episode(code=code)) for code in range(len(LABELS))]))
+
     # Importance sampling: calculates how many copies of each episod need to be generated
     def importance_sampling(self, episode, time):
+        duplication_value = self.importance_weights(np.array([episode.code]), np.array([episode.time]), time)[0]
+        return [episode] * duplication_value
+
+    # Vectorized importance sampling: number of copies of each (code, time) pair of episodes
+    def importance_weights(self, codes, times, time):
         mitigation_factor = 2.0
-        entropy_diff = self.entropy_difference(episode)
-        time_fading = (time - episode.time + 1) / mitigation_factor
+        entropy_diff = self.entropy_differences()[codes]
+        time_fading = (time - times + 1) / mitigation_factor
         consistency = entropy_diff / time_fading
-        if 0.0 <= consistency <= 0.005:
-            duplication_value = 0
-        elif 0.005 < consistency <= 0.3:
-            duplication_value = 1
-        elif 0.3 < consistency <= 0.6:
-            duplication_value = 2
-        else:
-            duplication_value = 3
-        return [episode] * duplication_value
+        # [0.0, 0.005] -> 0, (0.005, 0.3] -> 1, (0.3, 0.6] -> 2, everything else -> 3
+        duplication_values = np.searchsorted([0.005, 0.3, 0.6], consistency, side='left')
+        duplication_values[consistency < 0.0] = 3
+        return duplication_values
 
-    # Systematic Resampling
+    # Systematic Resampling over the cumulative weights of the samples
+    # Returns the indexes of the selected samples
     @staticmethod
-    def systematic_resampling(samples, to_generate=10):
-        output = []
-        sample_size = len(samples)
-        x = randint(0, sample_size)
-        increment = randint(2, sample_size-1)     # Avoids increments with undesirable effects (0, 1, len)
-        for i in range(to_generate):
-            output.append(samples[x % sample_size])
-            x += increment
-        return output
+    def systematic_resampling(weights, to_generate=10):
+        cumulative_weights = np.cumsum(weights, dtype=float)
+        step = cumulative_weights[-1] / to_generate
+        positions = (np.random.random_sample() + np.arange(to_generate)) * step
+        return np.searchsorted(cumulative_weights, positions, side='right')
 
     # Creates an episodic belief network based on previous beliefs
+    # Episodes are grouped by (code, time), since importance weights only depend on them, so that no duplicated
+    # samples are ever materialized
     @staticmethod
     def create_episodic(bn_list, time, generated_episodes=6, name="EpisodicMemory"):
-        weighted_samples = []
+        sample_codes = []
+        sample_weights = []
         for bn in bn_list:
-            episode_list = bn.get_episode_dataset()
-            for episode in episode_list:
-                samples = bn.importance_sampling(episode, time)
-                if samples:
-                    weighted_samples.append(samples)
-        # Flattens out list of lists
-        weighted_samples = [item for sublist in weighted_samples for item in sublist]
+            episode_dataset = bn.get_episode_dataset()
+            if len(episode_dataset) == 0:
+                continue
+            keys, occurrences = np.unique(episode_dataset.times * len(LABELS) + episode_dataset.codes,
+                                          return_counts=True)
+            codes = keys % len(LABELS)
+            weights = occurrences * bn.importance_weights(codes, keys // len(LABELS), time)
+            sample_codes.append(codes[weights > 0])
+            sample_weights.append(weights[weights > 0])
+        sample_codes = np.concatenate(sample_codes) if sample_codes else np.zeros(0, dtype=int)
+        sample_weights = np.concatenate(sample_weights) if sample_weights else np.zeros(0, dtype=int)
         # Checks that there are enough samples to produce a systematic resampling
-        if len(weighted_samples) < 4:
-            print "create_episodic: not enough samples. Needed at least 4, found " + str(len(weighted_samples))
+        if sample_weights.sum() < 4:
+            print "create_episodic: not enough samples. Needed at least 4, found " + str(sample_weights.sum())
             quit()
-        # Shuffles the list to prevent the first items to be the most likely to be selected
-        shuffle(weighted_samples)
         # Now peform Systematic Resampling
-        dataset = BeliefNetwork.systematic_resampling(weighted_samples, to_generate=generated_episodes)
-        # Copy the list without reference (avoids timing changes to the original episodes)
-        unreferenced_dataset = copy.deepcopy(dataset)
-        output_dataset = []
-        for sample in unreferenced_dataset:
-            # Change the time value of all the samples to the current one
-            sample.time = time
-            output_dataset.append(sample)
-            # Generate the symmetric episode
-            output_dataset.append(sample.generate_symmetric())
-        return BeliefNetwork(name, output_dataset)
+        codes = sample_codes[BeliefNetwork.systematic_resampling(sample_weights, to_generate=generated_episodes)]
+        # Every sample is followed by its symmetric episode, all with the current time value
+        codes = np.column_stack([codes, np.take(SYMMETRIC, codes)]).ravel()
+        # The new network forgets as the ones it has been generated from
+        return BeliefNetwork(name, EpisodeDataset(codes, np.full(len(codes), time, dtype=np.int64)),
+                             half_life=bn_list[0].half_life, window=bn_list[0].window)
 
     # Returns the reliability of the network as a real value between -1 and +1. Negative values denote degrees of
     # unreliability and vice versa.
     def get_reliability(self):
+        return self.cached("reliability", self.compute_reliability)
+
+    def compute_reliability(self):
         # Evaluate the trustworthiness of the network (as for Belief Estimation)
         be_query = self.bn.query(robot_belief='A', robot_action='A')
         x = be_query['informant_action', 'A']
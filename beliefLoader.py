@@ -0,0 +1,85 @@
+import os
+import re
+from multiprocessing import Pool
+
+from bayesianNetwork import BeliefNetwork
+from episodeDataset import EpisodeDataset
+
+"""
+Bulk loading of the informants' beliefs.
+All the informant files are discovered with a single directory scan and parsed in the background by a process pool,
+while lazy proxies are returned immediately: each network is only built the first time it is queried.
+"""
+
+INFORMANT_FILE = re.compile(r"^Informer(\d+)\.csv$")
+
+
+# Lists the "InformerN.csv" files of a directory, ordered by N. Stops at the first missing number, as labels must match
+# the positions in the list of beliefs
+def discover_informants(path=".\\datasets\\"):
+    if not os.path.isdir(path):
+        return []
+    numbers = set()
+    for filename in os.listdir(path):
+        match = INFORMANT_FILE.match(filename)
+        if match:
+            numbers.add(int(match.group(1)))
+    names = []
+    while len(names) in numbers:
+        names.append("Informer" + str(len(names)))
+    return names
+
+
+# Parses a CSV dataset. Runs in the worker processes, so it returns plain arrays
+def parse_dataset(filename):
+    dataset = EpisodeDataset.from_csv(filename)
+    return dataset.codes, dataset.times
+
+
+class BeliefLoader:
+    def __init__(self, path=".\\datasets\\", processes=None):
+        self.path = path
+        self.names = discover_informants(path)
+        self.results = None
+        if len(self.names) > 1:
+            pool = Pool(processes=processes)
+            self.results = pool.map_async(parse_dataset, [path + name + ".csv" for name in self.names])
+            # No more tasks: the workers exit as soon as the parsing is over
+            pool.close()
+
+    # Returns one lazy proxy for each discovered informant
+    def load_beliefs(self):
+        return [LazyBeliefNetwork(name, self, i) for i, name in enumerate(self.names)]
+
+    # Episode dataset of the i-th informant, waiting for the pool if it is still parsing
+    def episode_dataset(self, i):
+        if self.results is None:
+            return EpisodeDataset(*parse_dataset(self.path + self.names[i] + ".csv"))
+        codes, times = self.results.get()[i]
+        return EpisodeDataset(codes, times)
+
+
+class LazyBeliefNetwork(object):
+    def __init__(self, name, source, index=None):
+        self.name = name
+        self.source = source    # An EpisodeDataset or a BeliefLoader
+        self.index = index
+        self.network = None
+
+    # Builds the real network
+    def build_network(self):
+        if isinstance(self.source, BeliefLoader):
+            dataset = self.source.episode_dataset(self.index)
+        else:
+            dataset = self.source
+        self.network = BeliefNetwork(self.name, dataset)
+        self.source = None
+
+    # Every other attribute is delegated to the network, building it on first access
+    def __getattr__(self, attribute):
+        # Special and own attributes are never delegated, e.g. while the proxy is being copied
+        if attribute.startswith("__") or attribute == "network":
+            raise AttributeError(attribute)
+        if self.network is None:
+            self.build_network()
+        return getattr(self.network, attribute)
@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from faceDetection import FaceDetector
+
+"""
+Benchmark of the face detection modes on recorded frames.
+Runs the full-frame detector, the tracking detector, the downscaled detector and both together over the same sequence
+of frames (e.g. a capture session), and reports frames per second, detection rate and how much the 64x64 regions of
+interest differ from the full-frame ones.
+
+Usage:  python benchmarks/detectionBenchmark.py --frames recorded_frames_directory [--output results.json]
+        python benchmarks/detectionBenchmark.py --video recorded_session.avi
+"""
+
+VARIANTS = [
+    ("full_frame", dict()),
+    ("tracking", dict(tracking=True)),
+    ("downscale", dict(downscale=0.5)),
+    ("tracking_downscale", dict(tracking=True, downscale=0.5))
+]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+# Reads the recorded frames, from a directory of images (in name order) or from a video
+def read_frames(directory=None, video=None, limit=None):
+    frames = []
+    if directory is not None:
+        for filename in sorted(os.listdir(directory)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                frames.append(cv2.imread(os.path.join(directory, filename)))
+    else:
+        capture = cv2.VideoCapture(video)
+        success, frame = capture.read()
+        while success:
+            frames.append(frame)
+            success, frame = capture.read()
+    return frames[:limit]
+
+
+# Runs a detector over the frames in sequence. Returns the elapsed time and, for each frame, the region of interest and
+# the face rectangle (None when no face is found)
+def run_detector(detector, frames):
+    rois = []
+    faces = []
+    start = time.time()
+    for frame in frames:
+        roi = detector.detect(frame)
+        rois.append(roi)
+        faces.append(None if roi is None else detector.last_face)
+    return time.time() - start, rois, faces
+
+
+# Intersection over union of two (x, y, w, h) rectangles
+def intersection_over_union(a, b):
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    intersection = max(x1 - x0, 0) * max(y1 - y0, 0)
+    return float(intersection) / (a[2] * a[3] + b[2] * b[3] - intersection)
+
+
+def run(frames, repeat=3):
+    results = dict()
+    reference = None
+    for name, options in VARIANTS:
+        elapsed = []
+        for i in range(repeat):
+            # A new detector for every run, so that tracking always starts from the first frame
+            seconds, rois, faces = run_detector(FaceDetector(**options), frames)
+            elapsed.append(seconds)
+        if reference is None:
+            reference = (rois, faces)
+        both = [i for i in range(len(frames)) if rois[i] is not None and reference[0][i] is not None]
+        results[name] = {
+            "fps": len(frames) / min(elapsed),
+            "detection_rate": sum(roi is not None for roi in rois) / float(max(len(frames), 1)),
+            # Agreement with the full-frame detector, on the frames where both find a face
+            "mean_iou": float(np.mean([intersection_over_union(faces[i], reference[1][i]) for i in both]))
+            if both else None,
+            "mean_roi_difference": float(np.mean([np.abs(rois[i].astype(int) - reference[0][i]).mean()
+                                                  for i in both])) if both else None
+        }
+        print "[BENCHMARK] %-20s %8.1f fps" % (name, results[name]["fps"])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Face detection benchmark on recorded frames")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--frames", help="directory of recorded frames")
+    source.add_argument("--video", help="recorded video")
+    parser.add_argument("--limit", type=int, default=None, help="maximum number of frames")
+    parser.add_argument("--output", help="JSON file where results are written")
+    args = parser.parse_args()
+    frames = read_frames(args.frames, args.video, args.limit)
+    if len(frames) == 0:
+        print "[ERROR] detectionBenchmark: no frames found"
+        return 1
+    results = run(frames)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print output
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from cameraFrame import FrameConverter, BGR_COLOR_SPACE, RGB_COLOR_SPACE, YUV422_COLOR_SPACE
+
+"""
+Micro-benchmark of the camera frame conversion of Robot.get_camera_image.
+Compares the former per-pixel conversion with the zero-copy FrameConverter on synthetic getImageRemote results, for every
+camera resolution, and reports frames per second.
+
+Usage:  python benchmarks/frameBenchmark.py [--quick] [--output results.json]
+"""
+
+# NAOqi resolutions: 0 (160x120), 1 (320x240), 2 (640x480), 3 (1280x960)
+RESOLUTIONS = [(160, 120), (320, 240), (640, 480), (1280, 960)]
+QUICK_RESOLUTIONS = [(160, 120), (320, 240)]
+# Colour space -> layers
+COLOR_SPACES = {BGR_COLOR_SPACE: 3, RGB_COLOR_SPACE: 3, YUV422_COLOR_SPACE: 2}
+
+
+# Synthetic getImageRemote result: [width, height, layers, colour space, seconds, microseconds, data, ...]
+def synthetic_result(width, height, color_space=BGR_COLOR_SPACE):
+    layers = COLOR_SPACES[color_space]
+    data = np.random.randint(0, 256, size=width * height * layers).astype(np.uint8).tobytes()
+    return [width, height, layers, color_space, 0, 0, data, 0, 0.0, 0.0, 0.0, 0.0]
+
+
+# Conversion previously done by Robot.get_camera_image (BGR only)
+def legacy_conversion(result):
+    width, height = result[0], result[1]
+    image = np.zeros((height, width, 3), np.uint8)
+    values = map(ord, list(str(result[6])))
+    i = 0
+    for y in range(0, height):
+        for x in range(0, width):
+            image.itemset((y, x, 0), values[i + 0])
+            image.itemset((y, x, 1), values[i + 1])
+            image.itemset((y, x, 2), values[i + 2])
+            i += 3
+    return image
+
+
+# Frames per second of a conversion function
+def frames_per_second(function, number):
+    return number / min(timeit.repeat(function, number=number, repeat=3))
+
+
+def run(resolutions, legacy=True):
+    results = dict()
+    converter = FrameConverter()
+    for width, height in resolutions:
+        resolution = str(width) + "x" + str(height)
+        print "[BENCHMARK] resolution " + resolution
+        for color_space in sorted(COLOR_SPACES):
+            result = synthetic_result(width, height, color_space)
+            key = "|resolution=" + resolution + "|color_space=" + str(color_space)
+            results["FrameConverter" + key] = frames_per_second(lambda: converter.convert(result), 100)
+        if legacy:
+            result = synthetic_result(width, height)
+            if not np.array_equal(legacy_conversion(result), converter.convert(result)):
+                print "[ERROR] frameBenchmark: the conversions differ at " + resolution
+                quit(-1)
+            key = "|resolution=" + resolution + "|color_space=" + str(BGR_COLOR_SPACE)
+            results["legacy" + key] = frames_per_second(lambda: legacy_conversion(result), 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Camera frame conversion benchmark")
+    parser.add_argument("--quick", action="store_true", help="only the two lowest resolutions")
+    parser.add_argument("--no-legacy", action="store_true", help="skip the per-pixel conversion")
+    parser.add_argument("--output", help="JSON file where results are written")
+    args = parser.parse_args()
+    results = run(QUICK_RESOLUTIONS if args.quick else RESOLUTIONS, not args.no_legacy)
+    for key in sorted(results):
+        print "%-60s %12.1f fps" % (key, results[key])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
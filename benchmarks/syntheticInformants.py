@@ -0,0 +1,54 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from episodeDataset import EpisodeDataset
+
+"""
+Generation of synthetic informant histories, in the same format of datasets/examples/helper.csv and tricker.csv:
+the sticker alternates between the two boxes and every episode has its own time value.
+"""
+
+# Alternating episode codes of every kind of informant, as in the example datasets
+HELPER = [1, 0]     # truth_b, truth_a
+TRICKER = [2, 3]    # lie_a, lie_b
+
+
+# Builds the history of an informant. Kind is "helper" or "tricker"; with probability noise each episode is replaced by
+# its opposite behaviour (a lie for the helper, the truth for the tricker)
+def synthetic_history(kind, length, start_time=0, noise=0.0, random_state=None):
+    if kind == "helper":
+        pattern = HELPER
+    elif kind == "tricker":
+        pattern = TRICKER
+    else:
+        print "[ERROR] synthetic_history: invalid kind of informant " + str(kind)
+        quit(-1)
+    random_state = np.random if random_state is None else random_state
+    codes = np.array(pattern, dtype=np.uint8)[np.arange(length) % 2]
+    if noise > 0.0:
+        flipped = random_state.random_sample(length) < noise
+        # truth_a <-> lie_a and truth_b <-> lie_b keep the sticker position and swap the informant's honesty
+        opposite = np.array([2, 3, 0, 1], dtype=np.uint8)
+        codes[flipped] = opposite[codes[flipped]]
+    times = np.arange(start_time, start_time + length, dtype=np.int64)
+    return EpisodeDataset(codes, times)
+
+
+# Builds a population of informants, alternating helpers and trickers
+def synthetic_population(informants, length, noise=0.0, random_state=None):
+    kinds = ["helper", "tricker"]
+    return [synthetic_history(kinds[i % 2], length, noise=noise, random_state=random_state)
+            for i in range(informants)]
+
+
+# Writes a population as InformerN.csv files, readable by Robot.load_beliefs
+def write_population(path, datasets):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    for i, dataset in enumerate(datasets):
+        dataset.save_csv(os.path.join(path, "Informer" + str(i) + ".csv"))
+
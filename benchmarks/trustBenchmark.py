@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from bayesianNetwork import BeliefNetwork
+from episode import Episode
+from syntheticInformants import synthetic_history, synthetic_population
+
+"""
+Benchmark suite of the trust model.
+Times the per-trial operations of BeliefNetwork over synthetic informant populations of growing history length and size,
+emits the results as JSON and compares them with a stored baseline to catch latency regressions.
+
+Usage:  python benchmarks/trustBenchmark.py [--quick] [--output results.json] [--save-baseline]
+"""
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+HISTORY_LENGTHS = [10, 100, 1000, 10000, 100000, 1000000]
+INFORMANT_COUNTS = [1, 10, 100, 1000, 10000]
+QUICK_HISTORY_LENGTHS = [10, 1000, 100000]
+QUICK_INFORMANT_COUNTS = [1, 100]
+# History length of every informant in the population benchmarks
+POPULATION_HISTORY = 20
+
+
+# Best time per call, in seconds, of a function over some repetitions
+def measure(function, number=10, repeat=3):
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+# Number of calls per repetition, so that big inputs do not take forever
+def calls_for(size):
+    return max(1, min(100, 100000 // max(size, 1)))
+
+
+# Operations on a single informant, as a function of its history length
+def benchmark_history(length):
+    results = dict()
+    dataset = synthetic_history("helper", length)
+    bn = BeliefNetwork("Informer0", dataset)
+    number = calls_for(length)
+    results["BeliefNetwork.__init__"] = measure(lambda: BeliefNetwork("Informer0", dataset), number=number)
+    episode = Episode([1, 1, 1, 1], length)
+    results["update_belief"] = measure(lambda: bn.update_belief(episode), number=100)
+    results["decision_making"] = measure(lambda: bn.decision_making('A'), number=100)
+    results["belief_estimation"] = measure(lambda: bn.belief_estimation('A'), number=100)
+    # Reliability is cached by the network: the inference is timed on a cache miss, the cached value apart
+    results["get_reliability"] = measure(lambda: (bn.invalidate_cache(), bn.get_reliability()), number=100)
+    results["get_reliability_cached"] = measure(lambda: bn.get_reliability(), number=100)
+    return results
+
+
+# Operations over a whole population of informants, as a function of its size
+def benchmark_population(informants):
+    results = dict()
+    bn_list = [BeliefNetwork("Informer" + str(i), dataset)
+               for i, dataset in enumerate(synthetic_population(informants, POPULATION_HISTORY))]
+    time = POPULATION_HISTORY + 1
+    number = calls_for(informants * POPULATION_HISTORY)
+    results["create_episodic"] = measure(lambda: BeliefNetwork.create_episodic(bn_list, time), number=number)
+    results["create_full_episodic_bn"] = measure(lambda: BeliefNetwork.create_full_episodic_bn(bn_list, time),
+                                                 number=number)
+    return results
+
+
+# Runs the whole suite. Results are indexed by "operation|parameter=value"
+def run(history_lengths, informant_counts):
+    results = dict()
+    for length in history_lengths:
+        print "[BENCHMARK] history length " + str(length)
+        for operation, seconds in benchmark_history(length).items():
+            results[operation + "|history=" + str(length)] = seconds
+    for informants in informant_counts:
+        print "[BENCHMARK] informants " + str(informants)
+        for operation, seconds in benchmark_population(informants).items():
+            results[operation + "|informants=" + str(informants)] = seconds
+    return {
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "numpy": np.__version__},
+        "results": results
+    }
+
+
+# Compares results with a baseline. Returns the list of regressions, as (key, baseline, current) tuples
+def compare(report, baseline, tolerance=0.5):
+    regressions = []
+    for key, seconds in sorted(report["results"].items()):
+        if key in baseline["results"]:
+            reference = baseline["results"][key]
+            if seconds > reference * (1.0 + tolerance):
+                regressions.append((key, reference, seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trust model benchmark suite")
+    parser.add_argument("--quick", action="store_true", help="run a reduced grid")
+    parser.add_argument("--output", help="JSON file where results are written")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="JSON baseline to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown with respect to the baseline")
+    args = parser.parse_args()
+    if args.quick:
+        report = run(QUICK_HISTORY_LENGTHS, QUICK_INFORMANT_COUNTS)
+    else:
+        report = run(HISTORY_LENGTHS, INFORMANT_COUNTS)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print output
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(output)
+        print "[BENCHMARK] baseline saved in " + args.baseline
+        return 0
+    if not os.path.isfile(args.baseline):
+        print "[BENCHMARK] no baseline found in " + args.baseline
+        return 0
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance)
+    for key, reference, seconds in regressions:
+        print "[REGRESSION] %s: %.3e s -> %.3e s (x%.2f)" % (key, reference, seconds, seconds / reference)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+
+"""
+Conversion of the images returned by ALVideoDevice.getImageRemote into OpenCV BGR images.
+The raw buffer is wrapped with a zero-copy NumPy view, shaped from the width, height and layer fields of the result, and
+converted (or copied) into a buffer which is reused across frames, so a frame costs a single pass over its pixels.
+"""
+
+# Fields of the getImageRemote result
+WIDTH = 0
+HEIGHT = 1
+LAYERS = 2
+COLOR_SPACE = 3
+DATA = 6
+
+# NAOqi colour spaces -> OpenCV conversion to BGR. None when the data is already BGR.
+# Single layer colour spaces (Y, U, V, R, G, B, H, S or Y channel only, indexes 0 to 8) are converted as grayscale
+YUV422_COLOR_SPACE = 9
+YUV_COLOR_SPACE = 10
+RGB_COLOR_SPACE = 11
+BGR_COLOR_SPACE = 13
+CONVERSIONS = {
+    YUV422_COLOR_SPACE: cv2.COLOR_YUV2BGR_YUYV,
+    YUV_COLOR_SPACE: cv2.COLOR_YUV2BGR,
+    RGB_COLOR_SPACE: cv2.COLOR_RGB2BGR,
+    BGR_COLOR_SPACE: None
+}
+
+
+# Zero-copy view of the raw data of a getImageRemote result, shaped (height, width, layers)
+def frame_view(result):
+    width, height, layers = result[WIDTH], result[HEIGHT], result[LAYERS]
+    data = np.frombuffer(result[DATA], dtype=np.uint8, count=width * height * layers)
+    return data.reshape(height, width, layers)
+
+
+class FrameConverter:
+    def __init__(self):
+        self.buffer = None      # Output image, reused as long as the resolution does not change
+
+    # Output buffer of a given shape
+    def output(self, height, width, channels=3):
+        if self.buffer is None or self.buffer.shape != (height, width, channels):
+            self.buffer = np.zeros((height, width, channels), np.uint8)
+        return self.buffer
+
+    # Converts a getImageRemote result into a BGR image. The image is overwritten by the next conversion.
+    # Colour spaces without an OpenCV conversion are copied as they are
+    def convert(self, result):
+        view = frame_view(result)
+        height, width, layers = view.shape
+        if layers == 1:
+            return cv2.cvtColor(view, cv2.COLOR_GRAY2BGR, dst=self.output(height, width))
+        color_space = result[COLOR_SPACE]
+        if color_space in CONVERSIONS and CONVERSIONS[color_space] is not None:
+            return cv2.cvtColor(view, CONVERSIONS[color_space], dst=self.output(height, width))
+        image = self.output(height, width, layers)
+        # The raw buffer is read-only and owned by NAOqi: a single copy makes the frame drawable
+        np.copyto(image, view)
+        return image
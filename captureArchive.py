@@ -0,0 +1,180 @@
+import Queue
+import atexit
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+import cv2
+import numpy as np
+
+"""
+Archive of the face frames captured while enrolling the informants.
+Frames are queued without waiting and a background thread appends them in batches to one compressed archive per
+session, so the interaction never waits for the disk. Archives are files of chunks: a header (number of frames and their
+size, length of the compressed data), the labels and the zlib-compressed frames. A chunk truncated by a crash is
+ignored on reading. Starting a session keeps the last archives and removes the older ones.
+
+Usage:  python captureArchive.py archive_file output_directory      (extracts the frames as images)
+"""
+
+CAPTURES_PATH = "captures"
+EXTENSION = ".vbcap"
+MAGIC = "VBCAPT"
+FORMAT_VERSION = 1
+CHUNK_HEADER = struct.Struct("<IHHI")
+# Frames written together, and how long the writer waits to fill a batch (seconds)
+BATCH_SIZE = 64
+BATCH_DELAY = 0.5
+QUEUE_SIZE = 256
+# Session archives kept when a new session starts. None keeps all of them
+RETENTION = 20
+COMPRESSION = 6
+
+
+# Appends a chunk of frames of the same size to an archive, creating it if needed
+def append_chunk(filename, frames, labels, compression=COMPRESSION):
+    frames = np.ascontiguousarray(frames, dtype=np.uint8)
+    labels = np.asarray(labels, dtype="<i4")
+    data = zlib.compress(frames.tobytes(), compression)
+    with open(filename, 'ab') as f:
+        if f.tell() == 0:
+            f.write(MAGIC + struct.pack("<I", FORMAT_VERSION))
+        f.write(CHUNK_HEADER.pack(len(frames), frames.shape[1], frames.shape[2], len(data)))
+        f.write(labels.tobytes())
+        f.write(data)
+        f.flush()
+
+
+# Reads the chunks of an archive. Returns a list of (frames, labels), in order
+def read_archive(filename):
+    with open(filename, 'rb') as f:
+        content = f.read()
+    if content[:len(MAGIC)] != MAGIC:
+        print "[ERROR] read_archive: not a capture archive: " + filename
+        quit(-1)
+    version = struct.unpack_from("<I", content, len(MAGIC))[0]
+    if version != FORMAT_VERSION:
+        print "[ERROR] read_archive: unsupported version " + str(version) + " of " + filename
+        quit(-1)
+    chunks = []
+    offset = len(MAGIC) + 4
+    while offset + CHUNK_HEADER.size <= len(content):
+        count, height, width, length = CHUNK_HEADER.unpack_from(content, offset)
+        offset += CHUNK_HEADER.size
+        if offset + 4 * count + length > len(content):
+            break
+        labels = np.frombuffer(content, dtype="<i4", count=count, offset=offset).astype(np.int32)
+        offset += 4 * count
+        frames = np.frombuffer(zlib.decompress(content[offset:offset + length]), dtype=np.uint8)
+        offset += length
+        chunks.append((frames.reshape(count, height, width), labels))
+    return chunks
+
+
+class CaptureArchive(object):
+    """ Background writer of the capture archives
+    add never blocks: when the queue is full the frame is dropped and counted.
+    """
+
+    def __init__(self, path=CAPTURES_PATH, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE, retention=RETENTION):
+        self.path = path
+        self.batch_size = batch_size
+        self.retention = retention
+        self.frames = Queue.Queue(queue_size)
+        self.filename = None
+        self.writer = None
+        self.dropped = 0
+        self.written = 0
+
+    # Archives of the previous sessions, oldest first. Names only order sessions started in different seconds: ties are
+    # broken by the zero-padded session number
+    def sessions(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(os.path.join(self.path, f) for f in os.listdir(self.path) if f.endswith(EXTENSION))
+
+    # Starts a new archive, e.g. at the beginning of an experiment, and applies the retention policy
+    def start_session(self):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        # Sessions started in the same second are numbered after the last one, even if older ones have been removed
+        name = "session-" + time.strftime("%Y%m%d-%H%M%S") + "-"
+        numbers = [int(f[len(name):-len(EXTENSION)]) for f in os.listdir(self.path)
+                   if f.startswith(name) and f.endswith(EXTENSION) and f[len(name):-len(EXTENSION)].isdigit()]
+        filename = os.path.join(self.path, name + "%03d" % (max(numbers + [0]) + 1) + EXTENSION)
+        self.filename = filename
+        if self.retention is not None:
+            previous = [f for f in self.sessions() if f != filename]
+            # Frames queued for the previous archives are written before removing them
+            self.flush()
+            for old in previous[:max(len(previous) - self.retention + 1, 0)]:
+                os.remove(old)
+        return filename
+
+    # Queues a frame of an informant
+    def add(self, frame, label):
+        if self.filename is None:
+            self.start_session()
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.write_loop, name="CaptureArchive")
+            self.writer.daemon = True
+            self.writer.start()
+            atexit.register(self.flush)
+        try:
+            self.frames.put_nowait((self.filename, frame, label))
+        except Queue.Full:
+            self.dropped += 1
+
+    # Writer thread: collects a batch of frames and appends it to the archives
+    def write_loop(self):
+        while True:
+            batch = [self.frames.get()]
+            deadline = time.time() + BATCH_DELAY
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.frames.get(timeout=max(deadline - time.time(), 0)))
+                except Queue.Empty:
+                    break
+            try:
+                self.write(batch)
+            except BaseException, err:
+                print "[ERROR] CaptureArchive: " + str(err)
+            finally:
+                for item in batch:
+                    self.frames.task_done()
+
+    # Writes a batch: one chunk for each archive and frame size
+    def write(self, batch):
+        groups = dict()
+        for filename, frame, label in batch:
+            groups.setdefault((filename, frame.shape), []).append((frame, label))
+        for (filename, shape), items in sorted(groups.items()):
+            append_chunk(filename, [frame for frame, label in items], [label for frame, label in items])
+            self.written += len(items)
+
+    # Waits until the queued frames are written
+    def flush(self):
+        if self.writer is not None:
+            self.frames.join()
+
+
+# Extracts the frames of an archive as images named label-number.jpg
+def main():
+    if len(sys.argv) != 3:
+        print "Usage: python captureArchive.py archive_file output_directory"
+        return 1
+    if not os.path.isdir(sys.argv[2]):
+        os.makedirs(sys.argv[2])
+    counts = dict()
+    for frames, labels in read_archive(sys.argv[1]):
+        for frame, label in zip(frames, labels):
+            counts[label] = counts.get(label, 0) + 1
+            cv2.imwrite(os.path.join(sys.argv[2], str(label) + "-" + str(counts[label]) + ".jpg"), frame)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import json
+import os
+
+import numpy as np
+
+"""
+Versioned single-file container of metadata and NumPy arrays.
+Layout: magic string, format version (uint32), header length (uint64), JSON header with the metadata and the dtype,
+shape and offset of every array, then the raw arrays, each one aligned so that it can be memory-mapped.
+"""
+
+# Alignment of the arrays in the file
+ALIGNMENT = 64
+
+
+# Writes metadata and arrays in a container file. The file is written in a temporary file and then renamed
+def write_container(filename, metadata, arrays, magic, version):
+    descriptions = dict()
+    offset = 0
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        arrays[name] = array
+        descriptions[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({"version": version, "metadata": metadata, "arrays": descriptions})
+    # Magic number, header length and header, padded so that the arrays start aligned
+    preamble = magic + np.uint32(version).tobytes() + np.uint64(len(header)).tobytes() + header
+    preamble += "\0" * (-len(preamble) % ALIGNMENT)
+    temporary = filename + ".tmp"
+    with open(temporary, 'wb') as f:
+        f.write(preamble)
+        for name in sorted(arrays):
+            f.write(arrays[name].tobytes())
+            f.write("\0" * (-arrays[name].nbytes % ALIGNMENT))
+        f.flush()
+        os.fsync(f.fileno())
+    replace_file(temporary, filename)
+
+
+# Renames a temporary file over a file. On POSIX the rename replaces it atomically; Windows does not rename over an
+# existing file, which is removed first
+def replace_file(temporary, filename):
+    try:
+        os.rename(temporary, filename)
+    except OSError:
+        os.remove(filename)
+        os.rename(temporary, filename)
+
+
+# Reads a container file. Returns the metadata and a dictionary of read-only memory-mapped arrays
+def read_container(filename, magic, version):
+    with open(filename, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            print "[ERROR] read_container: invalid file " + filename
+            quit(-1)
+        file_version = int(np.frombuffer(f.read(4), dtype=np.uint32)[0])
+        if file_version > version:
+            print "[ERROR] read_container: unsupported version " + str(file_version) + " of " + filename
+            quit(-1)
+        header_length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        header = json.loads(f.read(header_length))
+    start = len(magic) + 12 + header_length
+    start += -start % ALIGNMENT
+    arrays = dict()
+    for name, description in header["arrays"].items():
+        shape = tuple(description["shape"])
+        dtype = np.dtype(str(description["dtype"]))
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(filename, dtype=dtype, mode='r', offset=start + description["offset"],
+                                     shape=shape)
+    return header["metadata"], arrays
@@ -1,100 +1,165 @@
-import csv
 import os.path
 
-from episode import Episode
+import numpy as np
+
+from episode import LABELS, RAW_DATA
+from episodeDataset import EpisodeDataset
 
 """
 This class collects data samples given by list o by CSV file and performs Maximum Likelihood Estimation (MLE)
+Beliefs can optionally forget: with a half-life, counts decay exponentially with the time of the episodes; with a window,
+only the most recent episodes are counted. Both keep a constant amount of memory per informant.
 """
 
+# Episodes retained for the episodic memory when counts decay and no window is given
+DECAY_RETENTION = 1000
+
 
 class DatasetParser:
     # Initializations at 1 to avoid dividing for zero
-    def __init__(self, data):
-        self.Xi = [1.0, 1.0]
-        self.Yi = [
-            [1.0, 1.0],
-            [1.0, 1.0]
-        ]
-        self.Xr = [1.0, 1.0]
-        self.Yr = [
-            [1.0, 1.0],
-            [1.0, 1.0],
-            [1.0, 1.0],
-            [1.0, 1.0]
-        ]
+    def __init__(self, data, half_life=None, window=None, counts=None):
+        self.Xi = np.ones(2)
+        self.Yi = np.ones((2, 2))
+        self.Xr = np.ones(2)
+        self.Yr = np.ones((4, 2))
+        # Occurrences of each kind of episode, in the same order of LABELS
+        self.pdf_counts = np.ones(len(LABELS))
         self.trial_number = 1
+        # True once the episodes have been summed into the count tables
+        self.counted = False
+        # TrustPopulation whose arrays hold the count tables, if any, and the corresponding row
+        self.population = None
+        self.population_index = None
         # If data contains a csv path, reads the data from it
         if isinstance(data, str) and data[-3:] == "csv" and os.path.isfile(data):
-            with open(data, 'rb') as csv_file:
-                reader = csv.reader(csv_file, delimiter=',')
-                episode_list = []
-                for row in reader:
-                    # Split data and time
-                    datalist = row[:-1]
-                    time = row[-1]
-                    # Transforms a list of strings in a list of ints
-                    int_datalist = map(int, datalist)
-                    episode_list.append(Episode(int_datalist, int(time)))
-                self.episode_dataset = episode_list
+            self.episode_dataset = EpisodeDataset.from_csv(data)
         # If data contains a list, it's pure data
         elif isinstance(data, list):
+            self.episode_dataset = EpisodeDataset.from_episodes(data)
+        elif isinstance(data, EpisodeDataset):
             self.episode_dataset = data
         else:
             print "[ERROR]. DatasetParser. Invalid data input: " + str(data)
             quit(-1)
+        # Forgetting. If both are given, counts decay and the window only bounds the retained episodes
+        self.half_life = half_life
+        self.window = window
+        self.reference_time = None      # Time value the decayed counts refer to
+        retention = window
+        if half_life is not None and window is None:
+            retention = DECAY_RETENTION
+        if retention is not None and self.episode_dataset.limit != retention:
+            self.episode_dataset = EpisodeDataset(self.episode_dataset.codes, self.episode_dataset.times,
+                                                  limit=retention)
+        # Count tables already computed, e.g. restored from a snapshot, make reading the dataset unnecessary
+        if counts is not None:
+            self.set_counts(counts)
+
+    # Replaces the count tables. counts is a dictionary with the tables and, for decaying counts, the reference time
+    def set_counts(self, counts):
+        self.Xi[:] = counts["Xi"]
+        self.Yi[:] = counts["Yi"]
+        self.Xr[:] = counts["Xr"]
+        self.Yr[:] = counts["Yr"]
+        self.pdf_counts[:] = counts["pdf_counts"]
+        self.reference_time = counts.get("reference_time")
+        self.trial_number = 1 + len(self.episode_dataset)
+        self.counted = True
+
+    # Returns a copy of the count tables, in the format accepted by set_counts
+    def get_counts(self):
+        if not self.counted:
+            self.read_dataset()
+        return {
+            "Xi": self.Xi.copy(),
+            "Yi": self.Yi.copy(),
+            "Xr": self.Xr.copy(),
+            "Yr": self.Yr.copy(),
+            "pdf_counts": self.pdf_counts.copy(),
+            "reference_time": self.reference_time
+        }
 
     # Parses a dataset and sums each parameter's occurrence
+    def read_dataset(self):
+        if self.half_life is not None and len(self.episode_dataset) > 0:
+            # Every episode weights according to its age with respect to the most recent one
+            self.reference_time = self.episode_dataset.times.max()
+            weights = 0.5 ** ((self.reference_time - self.episode_dataset.times) / float(self.half_life))
+            occurrences = np.bincount(self.episode_dataset.codes, weights=weights, minlength=len(LABELS))
+        else:
+            occurrences = self.episode_dataset.code_counts()
+        for code in range(len(LABELS)):
+            if occurrences[code] > 0:
+                self.count_code(code, occurrences[code])
+        self.trial_number += len(self.episode_dataset)
+        self.counted = True
+
+    # Sums the occurrences of an episode code into the count tables
     # Dataset structure: Xr, Yr, Xi, Yi
     # 0: box B, 1: box A
-    def read_dataset(self):
-        for episode in self.episode_dataset:
-            row = episode.raw_data
-            row = map(int, row)
-            Xr = row[0]
-            Yr = row[1]
-            Xi = row[2]
-            Yi = row[3]
-            # Root nodes
-            self.Xr[Xr] += 1
-            self.Xi[Xi] += 1
-            # One-parent node
-            self.Yi[Xi][Yi] += 1
-            # Two-parent node
-            self.Yr[int(str(Yi) + str(Xr), 2)][Yr] += 1
-            self.trial_number += 1
-
-    # Normalizes values through the CPT
+    def count_code(self, code, occurrences=1):
+        [Xr, Yr, Xi, Yi] = RAW_DATA[code]
+        # Root nodes
+        self.Xr[Xr] += occurrences
+        self.Xi[Xi] += occurrences
+        # One-parent node
+        self.Yi[Xi][Yi] += occurrences
+        # Two-parent node
+        self.Yr[Yi * 2 + Xr][Yr] += occurrences
+        self.pdf_counts[code] += occurrences
+
+    # Appends a new episode and updates the count tables in constant time
+    def add_episode(self, episode):
+        if not self.counted:
+            self.read_dataset()
+        weight = 1.0
+        if self.half_life is not None:
+            self.decay(episode.time)
+            # An episode older than the reference time is already partly forgotten
+            weight = 0.5 ** ((self.reference_time - episode.time) / float(self.half_life))
+        dropped = self.episode_dataset.append(episode)
+        # With a sliding window, the episode which left the window is not counted anymore
+        if dropped is not None and self.half_life is None:
+            self.count_code(dropped.code, -1)
+        self.count_code(episode.code, weight)
+        self.trial_number += 1
+
+    # Decays the counts up to a new time value. Only the observations decay, the initialization at 1 is preserved
+    def decay(self, time):
+        if self.reference_time is None:
+            self.reference_time = time
+        if time <= self.reference_time:
+            return
+        factor = 0.5 ** ((time - self.reference_time) / float(self.half_life))
+        # In place, as the tables may be views of a TrustPopulation
+        for table in [self.Xi, self.Yi, self.Xr, self.Yr, self.pdf_counts]:
+            table -= 1.0
+            table *= factor
+            table += 1.0
+        self.reference_time = time
+
+    # Normalizes values through the CPT. The count tables are left untouched, so that they can keep growing.
     def normalize(self):
-        self.Xi = self.mle(self.Xi[0], self.Xi[1])
-        self.Xr = self.mle(self.Xr[0], self.Xr[1])
-        self.Yi = [self.mle(x[0], x[1]) for x in self.Yi]
-        self.Yr = [self.mle(x[0], x[1]) for x in self.Yr]
+        return {
+            "Xr": self.mle(self.Xr),
+            "Yr": self.mle(self.Yr),
+            "Xi": self.mle(self.Xi),
+            "Yi": self.mle(self.Yi)
+        }
 
-    # Computes MLE
-    def mle(self, a, b):
-        return [a/(a+b), b/(a+b)]
+    # Computes MLE over the last axis of a count table
+    def mle(self, counts):
+        return counts / counts.sum(axis=-1, keepdims=True)
 
     # Does all the job
     def estimate_bn_parameters(self):
-        self.read_dataset()
-        self.normalize()
-        parameters = {
-            "Xr": self.Xr,
-            "Yr": self.Yr,
-            "Xi": self.Xi,
-            "Yi": self.Yi
-        }
-        return parameters
+        if not self.counted:
+            self.read_dataset()
+        return self.normalize()
 
     # Saves a dataset on file. Can be used to reconstruct a BN re-estimating its parameters
     def save(self, filename):
-        with open(filename, 'wb') as myfile:
-            wr = csv.writer(myfile, delimiter=",")
-            for episode in self.episode_dataset:
-                output = list(episode.raw_data)
-                output.append(episode.time)
-                wr.writerow(output)
+        self.episode_dataset.save_csv(filename)
 
     # Prints episodes
     def print_episodes(self):
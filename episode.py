@@ -1,44 +1,58 @@
 """
 This class models single actions performed during the Vanderbilt experiment.
+Only four episodes are legal, so each one is stored as a 2-bit code: labels, raw data and symmetric episodes are
+obtained by table lookups.
 """
 
-class Episode:
-    def __init__(self, data=None, time=0):
-        if data != [1, 1, 1, 1] and data != [0, 0, 0, 0] and data != [1, 1, 1, 0] and data != [0, 0, 0, 1]:
+# Labels of the four legal episodes, indexed by their code
+LABELS = ['truth_a', 'truth_b', 'lie_a', 'lie_b']
+# Raw data [Xr, Yr, Xi, Yi] of each code
+RAW_DATA = [
+    [1, 1, 1, 1],   # truth_a: sticker in A, informer said A
+    [0, 0, 0, 0],   # truth_b: sticker in B, informer said B
+    [0, 0, 0, 1],   # lie_a: sticker in A, informer said B
+    [1, 1, 1, 0]    # lie_b: sticker in B, informer said A
+]
+# Code of the symmetric lie / truth episode of each code
+SYMMETRIC = [1, 0, 3, 2]
+# Raw data packed as a 4-bit integer (Xr Yr Xi Yi) mapped to its code. INVALID marks illegal combinations
+INVALID = 255
+CODE_OF_PACKED = [INVALID] * 16
+for _code, _raw in enumerate(RAW_DATA):
+    CODE_OF_PACKED[_raw[0] * 8 + _raw[1] * 4 + _raw[2] * 2 + _raw[3]] = _code
+
+
+# Translates raw data in its code. Returns INVALID for illegal data
+def encode(data):
+    if not isinstance(data, (list, tuple)) or len(data) != 4 or any(bit not in (0, 1) for bit in data):
+        return INVALID
+    return CODE_OF_PACKED[data[0] * 8 + data[1] * 4 + data[2] * 2 + data[3]]
+
+
+class Episode(object):
+    __slots__ = ['code', 'time']
+
+    def __init__(self, data=None, time=0, code=None):
+        if code is None:
+            code = encode(data)
+        if not 0 <= code < len(LABELS):
             print "[ERROR] Episode. Invalid data input: " + str(data)
             quit(-1)
-        self.raw_data = data
+        self.code = code
         self.time = time
 
+    # Raw data [Xr, Yr, Xi, Yi] of the episode
+    @property
+    def raw_data(self):
+        return list(RAW_DATA[self.code])
+
     # Gets an appropriate label describing it's data
     def get_label(self):
-        if self.raw_data == [1, 1, 1, 1]:
-            return 'truth_a'
-        elif self.raw_data == [0, 0, 0, 0]:
-            return 'truth_b'
-        elif self.raw_data == [0, 0, 0, 1]:
-            return 'lie_a'
-        elif self.raw_data == [1, 1, 1, 0]:
-            return 'lie_b'
-        else:
-            print "[ERROR] Episode.get_label: invalid raw data " + str(self.raw_data)
-            quit(-1)
+        return LABELS[self.code]
 
     def __str__(self):
         return "Time = " + str(self.time) + ", Data = " + str(self.raw_data)
 
     # Generates the symmetric lie / truth episode
     def generate_symmetric(self):
-        new_raw_data = []
-        if self.raw_data == [1, 1, 1, 1]:
-            new_raw_data = [0, 0, 0, 0]
-        elif self.raw_data == [0, 0, 0, 0]:
-            new_raw_data = [1, 1, 1, 1]
-        elif self.raw_data == [0, 0, 0, 1]:
-            new_raw_data = [1, 1, 1, 0]
-        elif self.raw_data == [1, 1, 1, 0]:
-            new_raw_data = [0, 0, 0, 1]
-        else:
-            print "[ERROR] Episode.generate_symmetric: invalid raw data " + str(self.raw_data)
-            quit(-1)
-        return Episode(new_raw_data, self.time)
+        return Episode(time=self.time, code=SYMMETRIC[self.code])
@@ -0,0 +1,150 @@
+import numpy as np
+
+from episode import Episode, CODE_OF_PACKED, INVALID, LABELS, RAW_DATA
+
+"""
+This class stores a sequence of episodes as a pair of NumPy arrays: episode codes (uint8) and time values (int64).
+It behaves like the list of Episode it replaces (len, iteration, indexing, append) while keeping 9 bytes per episode and
+allowing vectorized parsing and estimation.
+"""
+
+# Lookup tables as arrays, for vectorized encoding and decoding
+CODE_OF_PACKED_ARRAY = np.array(CODE_OF_PACKED, dtype=np.uint8)
+RAW_DATA_ARRAY = np.array(RAW_DATA, dtype=np.int64)
+
+
+class EpisodeDataset(object):
+    def __init__(self, codes=None, times=None, capacity=16, limit=None):
+        codes = np.zeros(0, dtype=np.uint8) if codes is None else np.asarray(codes, dtype=np.uint8)
+        times = np.zeros(0, dtype=np.int64) if times is None else np.asarray(times, dtype=np.int64)
+        if codes.shape != times.shape:
+            print "[ERROR] EpisodeDataset. Codes and times have different lengths."
+            quit(-1)
+        # Maximum number of retained episodes: when it is reached, the oldest episode is dropped. None for unbounded
+        self.limit = limit
+        if limit is not None:
+            codes = codes[max(len(codes) - limit, 0):]
+            times = times[max(len(times) - limit, 0):]
+        self.size = len(codes)
+        # Episodes live in [start, start + size) of the buffers. Buffers are over-allocated so that appending (and
+        # dropping the oldest episode) is amortized constant time
+        self.start = 0
+        self.code_buffer = np.zeros(max(capacity, self.size), dtype=np.uint8)
+        self.time_buffer = np.zeros(max(capacity, self.size), dtype=np.int64)
+        self.code_buffer[:self.size] = codes
+        self.time_buffer[:self.size] = times
+
+    # Builds a dataset from a list of Episode
+    @staticmethod
+    def from_episodes(episode_list):
+        codes = [episode.code for episode in episode_list]
+        times = [episode.time for episode in episode_list]
+        return EpisodeDataset(codes, times)
+
+    # Builds a dataset from rows of raw data and time values: [Xr, Yr, Xi, Yi, time]
+    @staticmethod
+    def from_rows(rows):
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1, 5)
+        raw = rows[:, :4]
+        if np.any((raw != 0) & (raw != 1)):
+            print "[ERROR] EpisodeDataset. Invalid data input."
+            quit(-1)
+        codes = CODE_OF_PACKED_ARRAY[raw[:, 0] * 8 + raw[:, 1] * 4 + raw[:, 2] * 2 + raw[:, 3]]
+        if np.any(codes == INVALID):
+            print "[ERROR] EpisodeDataset. Invalid data input: " + str(raw[codes == INVALID][0].tolist())
+            quit(-1)
+        return EpisodeDataset(codes, rows[:, 4])
+
+    # Reads a dataset from a CSV file with one episode per row: Xr, Yr, Xi, Yi, time
+    @staticmethod
+    def from_csv(filename):
+        with open(filename, 'rb') as csv_file:
+            values = np.fromstring(csv_file.read().replace("\r", "").replace("\n", ","), dtype=np.int64, sep=",")
+        return EpisodeDataset.from_rows(values)
+
+    # Writes the dataset in the CSV format read by from_csv
+    def save_csv(self, filename):
+        with open(filename, 'wb') as csv_file:
+            if self.size > 0:
+                np.savetxt(csv_file, self.to_rows(), fmt="%d", delimiter=",", newline="\r\n")
+
+    # Rows of raw data and time values: [Xr, Yr, Xi, Yi, time]
+    def to_rows(self):
+        return np.column_stack([RAW_DATA_ARRAY[self.codes], self.times])
+
+    # Episode codes, as a view of the used part of the buffer
+    @property
+    def codes(self):
+        return self.code_buffer[self.start:self.start + self.size]
+
+    # Episode time values, as a view of the used part of the buffer
+    @property
+    def times(self):
+        return self.time_buffer[self.start:self.start + self.size]
+
+    # Occurrences of each episode code
+    def code_counts(self):
+        return np.bincount(self.codes, minlength=len(LABELS))
+
+    # Appends an episode. Returns the oldest episode if it has been dropped because of the limit, None otherwise
+    def append(self, episode):
+        dropped = None
+        if self.limit is not None and self.size == self.limit:
+            dropped = self[0]
+            self.start += 1
+            self.size -= 1
+        self.make_room(1)
+        self.code_buffer[self.start + self.size] = episode.code
+        self.time_buffer[self.start + self.size] = episode.time
+        self.size += 1
+        return dropped
+
+    # Appends all the episodes of another EpisodeDataset
+    def extend(self, dataset):
+        self.make_room(len(dataset))
+        end = self.start + self.size
+        self.code_buffer[end:end + len(dataset)] = dataset.codes
+        self.time_buffer[end:end + len(dataset)] = dataset.times
+        self.size += len(dataset)
+        if self.limit is not None and self.size > self.limit:
+            self.start += self.size - self.limit
+            self.size = self.limit
+
+    # Makes room for n more episodes at the end of the buffers, moving the episodes to the front when at least half of
+    # the buffers would stay free, or doubling them otherwise
+    def make_room(self, n):
+        if self.start + self.size + n <= len(self.code_buffer):
+            return
+        if 2 * (self.size + n) <= len(self.code_buffer):
+            self.code_buffer[:self.size] = self.codes.copy()
+            self.time_buffer[:self.size] = self.times.copy()
+            self.start = 0
+        else:
+            self.reserve(2 * (self.size + n))
+
+    # Enlarges the buffers to a new capacity
+    def reserve(self, capacity):
+        capacity = max(capacity, 1)
+        if capacity <= len(self.code_buffer):
+            return
+        code_buffer = np.zeros(capacity, dtype=np.uint8)
+        time_buffer = np.zeros(capacity, dtype=np.int64)
+        code_buffer[:self.size] = self.codes
+        time_buffer[:self.size] = self.times
+        self.code_buffer = code_buffer
+        self.time_buffer = time_buffer
+        self.start = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("EpisodeDataset index out of range")
+        return Episode(time=int(self.time_buffer[self.start + index]), code=int(self.code_buffer[self.start + index]))
+
+    def __iter__(self):
+        for code, time in zip(self.codes.tolist(), self.times.tolist()):
+            yield Episode(time=time, code=code)
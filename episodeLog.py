@@ -0,0 +1,210 @@
+import os
+import time
+
+import numpy as np
+
+from bayesianNetwork import BeliefNetwork
+from episode import LABELS
+from episodeDataset import EpisodeDataset
+
+"""
+This class manages an append-only binary log of the episodes of every informant.
+Each episode is a fixed-size record (time, informant id, episode code), appended and flushed as soon as it happens, so that
+a crash does not lose the session's episodes. A small text index maps informant ids to their names.
+The log is read through a memory map and the count tables of all the informants are built with vectorized operations.
+"""
+
+LOG_FILE = "episodes.log"
+INDEX_FILE = "episodes.idx"
+# File header: magic number and format version
+MAGIC = "VBEL"
+VERSION = 1
+HEADER_SIZE = 16
+# Fixed-size record, padded to 16 bytes
+RECORD = np.dtype({
+    'names': ['time', 'informant', 'code'],
+    'formats': ['<i8', '<u4', 'u1'],
+    'offsets': [0, 8, 12],
+    'itemsize': 16
+})
+
+
+class EpisodeLog:
+    def __init__(self, path=".\\datasets\\", sync=True):
+        self.path = path
+        self.sync = sync    # If True, every append is forced to disk before returning
+        self.names = None   # Informant names, indexed by id. Loaded lazily
+
+    # Full path of the binary log
+    def log_file(self):
+        return self.path + LOG_FILE
+
+    # Full path of the informant index
+    def index_file(self):
+        return self.path + INDEX_FILE
+
+    # Returns True if a log has already been written
+    def exists(self):
+        return os.path.isfile(self.log_file())
+
+    # Names of the known informants, indexed by id
+    def informants(self):
+        if self.names is None:
+            self.names = []
+            if os.path.isfile(self.index_file()):
+                with open(self.index_file(), 'rb') as f:
+                    for line in f:
+                        # Ignores a line truncated by a crash: complete lines end with a newline
+                        if line.endswith("\n") and "," in line:
+                            self.names.append(line.rstrip("\r\n").split(",", 1)[1])
+        return self.names
+
+    # Returns the id of an informant, adding it to the index if it is new
+    def register(self, name):
+        names = self.informants()
+        if name in names:
+            return names.index(name)
+        self.prepare()
+        self.truncate_index()
+        with open(self.index_file(), 'a') as f:
+            f.write(str(len(names)) + "," + name + "\n")
+            self.flush(f)
+        names.append(name)
+        return len(names) - 1
+
+    # Drops an index line truncated by a crash, so that the next one starts on its own line
+    def truncate_index(self):
+        if not os.path.isfile(self.index_file()):
+            return
+        with open(self.index_file(), 'r+b') as f:
+            content = f.read()
+            if content and not content.endswith("\n"):
+                f.truncate(content.rfind("\n") + 1)
+
+    # Creates the directory and the log header, if needed
+    def prepare(self):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        if not self.exists():
+            header = np.zeros(HEADER_SIZE, dtype=np.uint8)
+            header[:4] = np.frombuffer(MAGIC, dtype=np.uint8)
+            header[4:8] = np.frombuffer(np.uint32(VERSION).tobytes(), dtype=np.uint8)
+            with open(self.log_file(), 'wb') as f:
+                f.write(header.tobytes())
+                self.flush(f)
+
+    # Forces the written data to disk, if required
+    def flush(self, f):
+        f.flush()
+        if self.sync:
+            os.fsync(f.fileno())
+
+    # Appends a single episode of an informant
+    def append(self, name, episode):
+        records = np.zeros(1, dtype=RECORD)
+        records['time'] = episode.time
+        records['informant'] = self.register(name)
+        records['code'] = episode.code
+        self.write(records)
+
+    # Appends all the episodes of an EpisodeDataset
+    def extend(self, name, episode_dataset):
+        records = np.zeros(len(episode_dataset), dtype=RECORD)
+        records['time'] = episode_dataset.times
+        records['informant'] = self.register(name)
+        records['code'] = episode_dataset.codes
+        self.write(records)
+
+    # Writes records at the end of the log
+    def write(self, records):
+        self.prepare()
+        # Drops a record truncated by a crash, to keep the new ones aligned
+        torn = (os.path.getsize(self.log_file()) - HEADER_SIZE) % RECORD.itemsize
+        if torn:
+            with open(self.log_file(), 'r+b') as f:
+                f.truncate(os.path.getsize(self.log_file()) - torn)
+        with open(self.log_file(), 'ab') as f:
+            f.write(records.tobytes())
+            self.flush(f)
+
+    # Memory maps all the records of the log. A record truncated by a crash is ignored, as well as records whose
+    # informant did not make it to the index
+    def read(self):
+        records = self.read_all()
+        if len(records) > 0 and records['informant'].max() >= len(self.informants()):
+            records = records[records['informant'] < len(self.informants())]
+        return records
+
+    # Memory maps all the complete records of the log
+    def read_all(self):
+        if not self.exists():
+            return np.zeros(0, dtype=RECORD)
+        with open(self.log_file(), 'rb') as f:
+            if f.read(4) != MAGIC:
+                print "[ERROR] EpisodeLog.read: invalid log file " + self.log_file()
+                quit(-1)
+        length = (os.path.getsize(self.log_file()) - HEADER_SIZE) // RECORD.itemsize
+        if length <= 0:
+            return np.zeros(0, dtype=RECORD)
+        return np.memmap(self.log_file(), dtype=RECORD, mode='r', offset=HEADER_SIZE, shape=(length,))
+
+    # Occurrences of each episode code for every informant, as a (N, 4) array indexed by id
+    def count_tables(self):
+        records = self.read()
+        n = len(self.informants())
+        keys = records['informant'].astype(np.int64) * len(LABELS) + records['code']
+        return np.bincount(keys, minlength=n * len(LABELS)).reshape(n, len(LABELS))
+
+    # Episodes of every informant, as a list of EpisodeDataset indexed by id
+    def datasets(self):
+        records = self.read()
+        n = len(self.informants())
+        # A stable sort keeps the episodes of each informant in their original order
+        order = np.argsort(records['informant'], kind='mergesort')
+        codes = records['code'][order]
+        times = records['time'][order]
+        bounds = np.cumsum(np.bincount(records['informant'], minlength=n))
+        return [EpisodeDataset(c, t) for c, t in zip(np.split(codes, bounds[:-1]), np.split(times, bounds[:-1]))]
+
+    # Episodes of a single informant
+    def episode_dataset(self, name):
+        records = self.read()
+        records = records[records['informant'] == self.informants().index(name)]
+        return EpisodeDataset(records['code'], records['time'])
+
+    # Builds a BeliefNetwork for every informant in the log, ordered by id
+    def load_beliefs(self):
+        return [BeliefNetwork(name, dataset) for name, dataset in zip(self.informants(), self.datasets())]
+
+    # Imports the episodes of an informant from a CSV file in the DatasetParser format
+    def import_csv(self, name, filename):
+        self.extend(name, EpisodeDataset.from_csv(filename))
+
+    # Exports the episodes of every informant in a CSV file named after it
+    def export_csv(self, path=".\\datasets\\"):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name, dataset in zip(self.informants(), self.datasets()):
+            dataset.save_csv(path + name + ".csv")
+
+    # Moves the log and its index to a new directory, e.g. the log of a session which did not end cleanly, before a new
+    # one starts. Returns the path of the archived log, which can be read with EpisodeLog(path)
+    def archive(self):
+        path = os.path.join(self.path, "recovered-" + time.strftime("%Y%m%d-%H%M%S")) + os.sep
+        number = 1
+        while os.path.exists(path):
+            number += 1
+            path = os.path.join(self.path, "recovered-" + time.strftime("%Y%m%d-%H%M%S") + "-" + str(number)) + os.sep
+        os.makedirs(path)
+        for filename, name in [(self.log_file(), LOG_FILE), (self.index_file(), INDEX_FILE)]:
+            if os.path.isfile(filename):
+                os.rename(filename, path + name)
+        self.names = None
+        return path
+
+    # Deletes the log and its index
+    def reset(self):
+        for filename in [self.log_file(), self.index_file()]:
+            if os.path.isfile(filename):
+                os.remove(filename)
+        self.names = None
@@ -1,6 +1,7 @@
 import os.path
 
 import cv2
+import numpy as np
 
 
 # Creates the working directory or empties it
@@ -13,8 +14,202 @@ def prepare_workspace(dir_name):
             os.remove(os.path.join(dir_name, f))
 
 
+HAAR_FILE = ".\\classifiers\\haarcascade_frontalface_default.xml"
+# Side of the square regions of interest handed to face recognition
+ROI_SIZE = 64
+# Tracking: the search window extends the last face by this fraction of its size on every side, and only faces between
+# these fractions of its size are searched
+TRACKING_PADDING = 0.5
+TRACKING_MIN_SIZE = 0.7
+TRACKING_MAX_SIZE = 1.4
+
+
+class FaceDetector:
+    """ Resident face detector
+    The Haar cascade is loaded once, on the first detection, and the grayscale buffers are reused across frames, so each
+    frame only pays the detection itself. Drawing the detected faces onto the input image is optional.
+    With tracking, single face detections first search a padded window around the last face found, and fall back to the
+    whole frame when it is not there. With downscale < 1, the search runs on a reduced copy of the frame and the faces
+    are mapped back, so the regions of interest are still cropped from the full resolution frame.
+    """
+
+    def __init__(self, haar_xml=HAAR_FILE, scale_factor=1.4, min_neighbours=5, annotate=False, tracking=False,
+                 downscale=1.0, padding=TRACKING_PADDING):
+        self.haar_xml = haar_xml
+        self.scale_factor = scale_factor
+        self.min_neighbours = min_neighbours
+        self.annotate = annotate
+        self.tracking = tracking
+        self.downscale = downscale
+        self.padding = padding
+        self.face_cascade = None
+        self.gray = None
+        self.equalized = None
+        self.reduced = None
+        self.last_face = None       # (x, y, w, h) of the last face found, in full resolution
+        self.tracked_searches = 0   # Detections solved in the tracking window
+        self.full_searches = 0
+
+    # A new detector with the same configuration, e.g. for another thread
+    def clone(self):
+        return FaceDetector(self.haar_xml, self.scale_factor, self.min_neighbours, self.annotate, self.tracking,
+                            self.downscale, self.padding)
+
+    # Loads the Cascade Classifier
+    def load(self):
+        if not os.path.isfile(self.haar_xml):
+            print "[ERROR] Unable to load the HaarCascade classifier. Verify file: \"" + \
+                  os.path.relpath(self.haar_xml) + "\""
+            quit(-1)
+        self.face_cascade = cv2.CascadeClassifier(self.haar_xml)
+
+    # Converts an image to grayscale and equalizes its histogram, into the reused buffers
+    def preprocess(self, img):
+        if self.gray is None or self.gray.shape != img.shape[:2]:
+            self.gray = np.zeros(img.shape[:2], np.uint8)
+            self.equalized = np.zeros(img.shape[:2], np.uint8)
+        cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        cv2.equalizeHist(self.gray, dst=self.equalized)
+        return self.equalized
+
+    # Forgets the last face, e.g. when a new informant is in front of the robot
+    def reset_tracking(self):
+        self.last_face = None
+
+    # Detects the faces of an image. Returns their rectangles and weights
+    def detect_rectangles(self, gray, single=True):
+        if self.tracking and single and self.last_face is not None:
+            rects, weights = self.search_window(gray, self.last_face)
+            if len(rects) > 0:
+                self.tracked_searches += 1
+                self.last_face = biggest_rectangle(rects)
+                return rects, weights
+        self.full_searches += 1
+        rects, weights = self.search(gray)
+        self.last_face = biggest_rectangle(rects) if len(rects) > 0 else None
+        return rects, weights
+
+    # Searches the padded window around a face, for faces of similar size
+    def search_window(self, gray, face):
+        x, y, w, h = face
+        height, width = gray.shape[:2]
+        x0 = max(int(x - self.padding * w), 0)
+        y0 = max(int(y - self.padding * h), 0)
+        x1 = min(int(x + w + self.padding * w), width)
+        y1 = min(int(y + h + self.padding * h), height)
+        min_size = (int(w * TRACKING_MIN_SIZE), int(h * TRACKING_MIN_SIZE))
+        max_size = (int(w * TRACKING_MAX_SIZE), int(h * TRACKING_MAX_SIZE))
+        rects, weights = self.search(gray[y0:y1, x0:x1], min_size, max_size)
+        if len(rects) > 0:
+            rects = rects + np.array([x0, y0, 0, 0])
+        return rects, weights
+
+    # Runs the cascade on an image, reduced by downscale. Rectangles are returned in the coordinates of the image
+    def search(self, gray, min_size=None, max_size=None):
+        if self.face_cascade is None:
+            self.load()
+        scale = self.downscale
+        image = gray
+        if scale != 1.0:
+            size = (max(int(gray.shape[1] * scale), 1), max(int(gray.shape[0] * scale), 1))
+            if gray is self.equalized:
+                # Whole frames are reduced into a reused buffer
+                if self.reduced is None or self.reduced.shape != (size[1], size[0]):
+                    self.reduced = np.zeros((size[1], size[0]), np.uint8)
+                image = cv2.resize(gray, size, dst=self.reduced, interpolation=cv2.INTER_AREA)
+            else:
+                image = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        options = dict()
+        if min_size is not None:
+            options["minSize"] = (int(min_size[0] * scale), int(min_size[1] * scale))
+            options["maxSize"] = (int(max_size[0] * scale), int(max_size[1] * scale))
+        faces = self.face_cascade.detectMultiScale3(image, scaleFactor=self.scale_factor,
+                                                    minNeighbors=self.min_neighbours, outputRejectLevels=True,
+                                                    **options)
+        rects = np.asarray(faces[0], dtype=int).reshape(-1, 4)
+        if scale != 1.0:
+            rects = np.round(rects / scale).astype(int)
+        return rects, faces[2]
+
+    def detect(self, img, single=True, grayscale=True, annotate=None, debug=False):
+        """ Performs facial detection within an image
+        :param img: image data matrix
+        :param single: search for single (True) or multiple (False) faces
+        :param grayscale: if True, converts the image to grayscale
+        :param annotate: if True, draws the detected faces onto img. None for the detector default
+        :param debug: if True, enables verbose output
+        :return: greyscale region(s) of interest, scaled to 64x64 pixels
+        """
+
+        if img is None:
+            return
+        annotate = self.annotate if annotate is None else annotate
+
+        if grayscale:
+            gray = self.preprocess(img)
+        else:
+            # I keep the variable name because this is a late update
+            gray = img
+        if debug:
+            # Shows the color (and eventually the gray) image
+            cv2.imshow("img", img)
+            cv2.waitKey(0)
+            cv2.destroyAllWindows()
+            if grayscale:
+                cv2.imshow("gray", gray)
+                cv2.waitKey(0)
+                cv2.destroyAllWindows()
+
+        rects, weights = self.detect_rectangles(gray, single)
+        if len(rects) == 0:
+            return None
+        if annotate or debug:
+            for c, (x, y, w, h) in enumerate(rects):
+                cv2.rectangle(img, (x, y), (x + w, y + h), (255, 0, 0), 2)
+                cv2.putText(img, str(weights[c][0]), (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
+                if debug:
+                    cv2.imshow("rectangled", img)
+                    cv2.waitKey(0)
+                    cv2.destroyAllWindows()
+        if single:
+            # Only the biggest rectangle (nearest to the robot) is cropped
+            rects = [biggest_rectangle(rects)]
+        roi_list = [crop(gray, rect) for rect in rects]
+        return roi_list[0] if single else roi_list
+
+    # Detects every face of an image, e.g. a group of informants sitting side by side
+    # Returns a list of (rectangle, region of interest), ordered from left to right. Empty if there are no faces
+    def detect_all(self, img, grayscale=True, annotate=None):
+        if img is None:
+            return []
+        gray = self.preprocess(img) if grayscale else img
+        rects, weights = self.detect_rectangles(gray, single=False)
+        if self.annotate if annotate is None else annotate:
+            for c, (x, y, w, h) in enumerate(rects):
+                cv2.rectangle(img, (x, y), (x + w, y + h), (255, 0, 0), 2)
+                cv2.putText(img, str(weights[c][0]), (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
+        return [(tuple(rect), crop(gray, rect)) for rect in sorted(rects, key=lambda rect: rect[0])]
+
+
+# Crops a (x, y, w, h) rectangle of a grayscale image and scales it to the size of the regions of interest
+def crop(gray, rect):
+    x, y, w, h = rect
+    return cv2.resize(gray[y:y + h, x:x + w], (ROI_SIZE, ROI_SIZE), interpolation=cv2.INTER_AREA)
+
+
+# The biggest of some (x, y, w, h) rectangles
+def biggest_rectangle(rects):
+    areas = [w * h for (x, y, w, h) in rects]
+    return rects[areas.index(max(areas))]
+
+
+# Detector shared by the calls to facial_detection, one for each set of detection parameters
+shared_detectors = dict()
+
+
 def facial_detection(img, scale_factor=1.4, min_neighbours=5, single=True, debug=False, grayscale=True):
-    """ Performs facial detection within an image
+    """ Performs facial detection within an image. Compatibility wrapper of FaceDetector.detect: the detected faces are
+    drawn onto img
     :param img: image data matrix
     :param scale_factor: how much the image size is reduced at each image scale
     :param min_neighbours: how many neighbors each candidate rectangle should have to retain it
@@ -24,61 +219,7 @@ def facial_detection(img, scale_factor=1.4, min_neighbours=5, single=True, debug
     :return: greyscale region(s) of interest, scaled to 64x64 pixels
     """
 
-    if img is None:
-        return
-
-    # Creates a Cascade Classifier and loads the default training data
-    haar_xml = ".\\classifiers\\haarcascade_frontalface_default.xml"
-    if not os.path.isfile(haar_xml):
-        print "[ERROR] Unable to load the HaarCascade classifier. Verify file: \"" + os.path.relpath(haar_xml) + "\""
-        quit(-1)
-    face_cascade = cv2.CascadeClassifier(haar_xml)
-
-    if grayscale:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        # Histogram equalization
-        gray = cv2.equalizeHist(gray)
-    else:
-        # I keep the variable name because this is a late update
-        gray = img
-    if debug:
-        # Shows the color (and eventually the gray) image
-        cv2.imshow("img", img)
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
-        if grayscale:
-            cv2.imshow("gray", gray)
-            cv2.waitKey(0)
-            cv2.destroyAllWindows()
-
-    faces = face_cascade.detectMultiScale3(gray, scaleFactor=scale_factor, minNeighbors=min_neighbours,
-                                           outputRejectLevels=True)
-    rects = faces[0]
-    #neighbours = faces[1]
-    weights = faces[2]
-    roi_list = []
-    roi_areas = []
-    c = 0
-    for (x, y, w, h) in rects:
-        img = cv2.rectangle(img, (x, y), (x + w, y + h), (255, 0, 0), 2)
-        cv2.putText(img, str(weights[c][0]), (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
-        if debug:
-            cv2.imshow("rectangled", img)
-            cv2.waitKey(0)
-            cv2.destroyAllWindows()
-        roi = gray[y:y + h, x:x + w]
-        roi_area = reduce(lambda x, y: x * y, roi.shape)
-        roi_resized = cv2.resize(roi, (64, 64), interpolation=cv2.INTER_AREA)
-        roi_list.append(roi_resized)
-        roi_areas.append(roi_area)
-        c += 1
-
-    if len(roi_list) == 0:
-        return None
-    elif single:
-        # Gets the biggest rectangle (nearest to the robot)
-        max_value = max(roi_areas)
-        max_index = roi_areas.index(max_value)
-        return roi_list[max_index]
-    else:
-        return roi_list
+    key = (scale_factor, min_neighbours)
+    if key not in shared_detectors:
+        shared_detectors[key] = FaceDetector(scale_factor=scale_factor, min_neighbours=min_neighbours, annotate=True)
+    return shared_detectors[key].detect(img, single=single, grayscale=grayscale, debug=debug)
@@ -0,0 +1,263 @@
+import numpy as np
+
+from containerFile import read_container, write_container
+
+"""
+Vectorized LBPH face index.
+Local Binary Patterns histograms of the 64x64 regions of interest are stored as the rows of one contiguous matrix, so a
+probe face is compared with the whole gallery by a few vectorized operations instead of one comparison per sample.
+Histograms use uniform patterns (59 bins) over a grid of cells; each cell histogram is normalized and stored as its
+square root, so the dot product of two rows is the Bhattacharyya coefficient of their histograms.
+Search metrics: "chi2" (OpenCV's alternative chi-square, the distance used by the LBPH recognizer) or "cosine". By default
+the search is exact. Two approximations are opt-in, for very big galleries: with candidates set, the probe is first
+compared with the centroid of each informant and only the samples of the closest informants are searched; with rerank
+set, chi-square distances are only computed for the rows closest by cosine. Both may return a different label than the
+exact search. The exact chi-square search takes a few milliseconds per thousand samples, computed in blocks of rows over
+the bins where the probe is not empty; the approximations are meant for galleries of tens of thousands of samples.
+The index also implements the train / update / predict / save / load interface of the OpenCV recognizers.
+"""
+
+METRICS = ["chi2", "cosine"]
+# Default distance above which a face is unknown, for each metric. Cosine distances are in [0, 1]: on 64x64 faces they
+# are about 1/270 of the chi-square ones, so 0.37 matches the chi-square threshold of 100
+THRESHOLDS = {"chi2": 100.0, "cosine": 0.37}
+GRID = 8
+# Suggested settings of the approximate search: informants whose samples are searched after the centroid pruning, and
+# rows, among the closest by cosine, whose chi-square distance is computed
+CANDIDATES = 32
+RERANK = 16
+# Gallery rows whose chi-square distances are computed together, to keep the temporary arrays small
+BLOCK_ROWS = 512
+MAGIC = "VBFIDX"
+FORMAT_VERSION = 1
+
+
+# Maps the 256 patterns of 8 neighbours to 58 uniform patterns (at most two 0/1 transitions) and one bin for the others
+def uniform_patterns():
+    table = np.zeros(256, dtype=np.intp)
+    uniform = 0
+    for pattern in range(256):
+        bits = [(pattern >> i) & 1 for i in range(8)]
+        transitions = sum(bits[i] != bits[(i + 1) % 8] for i in range(8))
+        if transitions <= 2:
+            table[pattern] = uniform
+            uniform += 1
+        else:
+            table[pattern] = 58
+    return table
+
+
+UNIFORM_PATTERNS = uniform_patterns()
+BINS = 59
+# Neighbours of a pixel, clockwise from the top left one
+NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
+
+
+# Uniform LBP code of every inner pixel of a batch of grayscale images, shape (M, H - 2, W - 2)
+def lbp_codes(images):
+    height, width = images.shape[1:]
+    center = images[:, 1:-1, 1:-1]
+    codes = np.zeros(center.shape, dtype=np.uint8)
+    for bit, (dy, dx) in enumerate(NEIGHBOURS):
+        neighbour = images[:, 1 + dy:height - 1 + dy, 1 + dx:width - 1 + dx]
+        codes |= (neighbour >= center).astype(np.uint8) << bit
+    return UNIFORM_PATTERNS[codes]
+
+
+# Feature rows of a batch of grayscale images: square roots of the normalized histogram of each cell, shape (M, D)
+def lbp_features(images, grid=GRID):
+    images = np.asarray(images, dtype=np.uint8)
+    if images.ndim == 2:
+        images = images[np.newaxis]
+    codes = lbp_codes(images)
+    count, height, width = codes.shape
+    # Cell of every pixel, then one bincount over the whole batch
+    cells = (np.arange(height) * grid // height)[:, np.newaxis] * grid + (np.arange(width) * grid // width)
+    bins = (np.arange(count)[:, np.newaxis, np.newaxis] * grid * grid + cells) * BINS + codes
+    histograms = np.bincount(bins.ravel(), minlength=count * grid * grid * BINS)
+    histograms = histograms.reshape(count, grid * grid, BINS).astype(np.float32)
+    histograms /= np.maximum(histograms.sum(axis=2, keepdims=True), 1)
+    return np.sqrt(histograms).reshape(count, grid * grid * BINS)
+
+
+class FaceIndex(object):
+    def __init__(self, metric="chi2", grid=GRID, threshold=None, candidates=None, rerank=None, capacity=1024):
+        if metric not in METRICS:
+            print "[ERROR] FaceIndex. Invalid metric: " + str(metric)
+            quit(-1)
+        self.metric = metric
+        self.grid = grid
+        self.threshold = threshold      # Distance above which a face is unknown (-1). None to always answer
+        self.candidates = candidates    # None searches the whole gallery
+        self.rerank = rerank            # None computes the chi-square distance of every searched row
+        self.size = 0
+        self.features = np.zeros((capacity, grid * grid * BINS), dtype=np.float32)
+        self.labels = np.zeros(capacity, dtype=np.int32)
+        # Centroids: sum of the rows of each informant, and their number
+        self.informants = []            # Labels, in the order of the centroid rows
+        self.centroid_sums = np.zeros((0, grid * grid * BINS), dtype=np.float64)
+        self.centroid_counts = np.zeros(0, dtype=np.int64)
+        self.centroids = None           # Mean rows, computed when needed
+
+    def __len__(self):
+        return self.size
+
+    # Enlarges the gallery. Also makes it writable after a memory-mapped load
+    def reserve(self, capacity):
+        if capacity <= len(self.features) and self.features.flags.writeable:
+            return
+        capacity = max(capacity, 2 * len(self.features), 1)
+        features = np.zeros((capacity, self.features.shape[1]), dtype=np.float32)
+        labels = np.zeros(capacity, dtype=np.int32)
+        features[:self.size] = self.features[:self.size]
+        labels[:self.size] = self.labels[:self.size]
+        self.features = features
+        self.labels = labels
+
+    # Adds the face samples of one or more informants
+    def add(self, images, labels):
+        self.add_features(lbp_features(images, self.grid), labels)
+
+    # Adds feature rows already extracted by lbp_features, e.g. stored with the face model
+    def add_features(self, rows, labels):
+        labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+        self.reserve(self.size + len(rows))
+        self.features[self.size:self.size + len(rows)] = rows
+        self.labels[self.size:self.size + len(rows)] = labels
+        self.size += len(rows)
+        for label in np.unique(labels):
+            mask = labels == label
+            self.add_to_centroid(int(label), rows[mask].sum(axis=0), int(mask.sum()))
+
+    def add_to_centroid(self, label, row_sum, count):
+        if label not in self.informants:
+            self.informants.append(label)
+            self.centroid_sums = np.vstack([self.centroid_sums, np.zeros((1, self.centroid_sums.shape[1]))])
+            self.centroid_counts = np.append(self.centroid_counts, 0)
+        position = self.informants.index(label)
+        self.centroid_sums[position] += row_sum
+        self.centroid_counts[position] += count
+        self.centroids = None
+
+    # Removes all the samples of an informant
+    def remove(self, label):
+        if label not in self.informants:
+            return
+        self.reserve(self.size)
+        keep = self.labels[:self.size] != label
+        kept = int(keep.sum())
+        self.features[:kept] = self.features[:self.size][keep]
+        self.labels[:kept] = self.labels[:self.size][keep]
+        self.size = kept
+        position = self.informants.index(label)
+        del self.informants[position]
+        self.centroid_sums = np.delete(self.centroid_sums, position, axis=0)
+        self.centroid_counts = np.delete(self.centroid_counts, position)
+        self.centroids = None
+
+    # Rows of the gallery to be searched for a probe: all of them, or the samples of the informants with the closest
+    # centroids
+    def candidate_rows(self, probe):
+        if self.candidates is None or len(self.informants) <= self.candidates:
+            return None
+        if self.centroids is None:
+            self.centroids = (self.centroid_sums / self.centroid_counts[:, np.newaxis]).astype(np.float32)
+        similarities = self.centroids.dot(probe)
+        closest = np.argpartition(-similarities, self.candidates - 1)[:self.candidates]
+        return np.flatnonzero(np.in1d(self.labels[:self.size], np.array(self.informants)[closest]))
+
+    # Distances between a probe row and some gallery rows
+    def distances(self, probe, rows):
+        if self.metric == "cosine":
+            # Rows have the same norm (one per cell), so the dot product gives the cosine
+            return 1.0 - rows.dot(probe) / (self.grid * self.grid)
+        # Chi-square of histograms h (rows) and p (probe): 2 * sum((h - p)^2 / (h + p)) = 2 * sum(h + p) - 8 * sum(h * p /
+        # (h + p)). The histograms of a row sum to one per cell, and the last sum only involves the bins where the probe
+        # is not zero
+        bins = np.flatnonzero(probe)
+        probe_histogram = probe[bins] * probe[bins]
+        similarities = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), BLOCK_ROWS):
+            histograms = rows[start:start + BLOCK_ROWS].take(bins, axis=1)
+            histograms *= histograms
+            products = histograms * probe_histogram
+            histograms += probe_histogram
+            products /= histograms
+            similarities[start:start + BLOCK_ROWS] = products.sum(axis=1)
+        return np.maximum(2.0 * (self.grid * self.grid + probe_histogram.sum()) - 8.0 * similarities, 0.0)
+
+    # Nearest neighbours of a face: returns up to k (label, distance), closest first, one per informant
+    def search(self, image, k=1):
+        if self.size == 0:
+            return []
+        probe = lbp_features(image, self.grid)[0]
+        indexes = self.candidate_rows(probe)
+        if indexes is None:
+            rows = self.features[:self.size]
+            labels = self.labels[:self.size]
+        else:
+            rows = self.features[indexes]
+            labels = self.labels[indexes]
+        rerank = None if self.rerank is None else max(self.rerank, 4 * k)
+        if self.metric == "chi2" and rerank is not None and len(rows) > rerank:
+            # Cosine pre-ranking: the exact chi-square is only computed for the closest rows
+            closest = np.argpartition(-rows.dot(probe), rerank - 1)[:rerank]
+            rows = rows[closest]
+            labels = labels[closest]
+        distances = self.distances(probe, rows)
+        if k == 1:
+            i = int(np.argmin(distances))
+            return [(int(labels[i]), float(distances[i]))]
+        results = []
+        for i in np.argsort(distances):
+            if int(labels[i]) not in [label for label, distance in results]:
+                results.append((int(labels[i]), float(distances[i])))
+                if len(results) == k:
+                    break
+        return results
+
+    # OpenCV recognizer interface
+
+    def train(self, images, labels):
+        self.size = 0
+        self.informants = []
+        self.centroid_sums = np.zeros((0, self.features.shape[1]), dtype=np.float64)
+        self.centroid_counts = np.zeros(0, dtype=np.int64)
+        self.centroids = None
+        self.add(images, labels)
+
+    def update(self, images, labels):
+        self.add(images, labels)
+
+    # Returns the label of the nearest sample and its distance. -1 if it is farther than the threshold
+    def predict(self, image):
+        results = self.search(image)
+        if len(results) == 0:
+            return -1, float("inf")
+        label, distance = results[0]
+        if self.threshold is not None and distance >= self.threshold:
+            return -1, distance
+        return label, distance
+
+    def save(self, filename):
+        metadata = {"metric": self.metric, "grid": self.grid, "informants": self.informants}
+        arrays = {
+            "features": self.features[:self.size],
+            "labels": self.labels[:self.size],
+            "centroid_sums": self.centroid_sums,
+            "centroid_counts": self.centroid_counts
+        }
+        write_container(filename, metadata, arrays, MAGIC, FORMAT_VERSION)
+
+    # Loads a saved index. The gallery is memory-mapped until it is modified
+    def load(self, filename):
+        metadata, arrays = read_container(filename, MAGIC, FORMAT_VERSION)
+        self.metric = metadata["metric"]
+        self.grid = metadata["grid"]
+        self.informants = metadata["informants"]
+        self.features = arrays["features"]
+        self.labels = arrays["labels"]
+        self.size = len(self.labels)
+        self.centroid_sums = np.array(arrays["centroid_sums"])
+        self.centroid_counts = np.array(arrays["centroid_counts"])
+        self.centroids = None
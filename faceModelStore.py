@@ -0,0 +1,113 @@
+import json
+import os
+
+import numpy as np
+
+from containerFile import read_container, replace_file, write_container
+from faceIndex import GRID
+
+"""
+Incremental store of the face recognition model.
+The face samples of the informants, with their labels and, for the histogram index, their LBP histograms (see faceIndex),
+are appended as binary chunk files; a JSON manifest lists the chunks of the model and is replaced atomically after every change. Enrolling an
+informant writes a chunk with its samples only, instead of serializing the whole model again. When there are too many
+chunks they are compacted into one. Chunks are memory-mapped on load.
+"""
+
+MODEL_STORE = ".\\classifiers\\face_model\\"
+MANIFEST_FILE = "manifest.json"
+MAGIC = "VBFACE"
+FORMAT_VERSION = 1
+# Chunks beyond which the store is compacted
+MAX_CHUNKS = 32
+
+
+class FaceModelStore(object):
+    def __init__(self, path=MODEL_STORE, max_chunks=MAX_CHUNKS, grid=GRID):
+        self.path = path
+        self.max_chunks = max_chunks
+        self.grid = grid
+
+    def manifest_file(self):
+        return os.path.join(self.path, MANIFEST_FILE)
+
+    def exists(self):
+        return os.path.isfile(self.manifest_file())
+
+    # Chunk list and next chunk number
+    def read_manifest(self):
+        if not self.exists():
+            return {"version": FORMAT_VERSION, "grid": self.grid, "chunks": [], "next": 0}
+        with open(self.manifest_file(), 'r') as f:
+            return json.load(f)
+
+    # Replaces the manifest atomically
+    def write_manifest(self, manifest):
+        temporary = self.manifest_file() + ".tmp"
+        with open(temporary, 'w') as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        replace_file(temporary, self.manifest_file())
+
+    # Writes a new chunk file and returns its manifest entry. Histograms are only stored if given
+    def write_chunk(self, manifest, images, labels, histograms=None):
+        images = np.asarray(images, dtype=np.uint8)
+        filename = "chunk-%06d.bin" % manifest["next"]
+        manifest["next"] += 1
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        arrays = {"images": images, "labels": np.asarray(labels, dtype=np.int32)}
+        if histograms is not None:
+            arrays["histograms"] = np.asarray(histograms, dtype=np.float32)
+        write_container(os.path.join(self.path, filename), {"samples": len(images)}, arrays, MAGIC, FORMAT_VERSION)
+        return {"file": filename, "samples": len(images)}
+
+    # Appends the samples of one or more informants
+    def append(self, images, labels, histograms=None):
+        manifest = self.read_manifest()
+        manifest["chunks"].append(self.write_chunk(manifest, images, labels, histograms))
+        self.write_manifest(manifest)
+        if len(manifest["chunks"]) > self.max_chunks:
+            self.compact()
+
+    # Replaces the whole model
+    def reset(self, images, labels, histograms=None):
+        manifest = self.read_manifest()
+        old_chunks = manifest["chunks"]
+        manifest["chunks"] = [self.write_chunk(manifest, images, labels, histograms)]
+        self.write_manifest(manifest)
+        self.remove_chunks(old_chunks)
+
+    # Merges all the chunks into one
+    def compact(self):
+        images, labels, histograms = self.load()
+        manifest = self.read_manifest()
+        old_chunks = manifest["chunks"]
+        manifest["chunks"] = [self.write_chunk(manifest, images, labels, histograms)]
+        self.write_manifest(manifest)
+        self.remove_chunks(old_chunks)
+
+    # Removes chunk files which are not in the manifest anymore
+    def remove_chunks(self, chunks):
+        for chunk in chunks:
+            filename = os.path.join(self.path, chunk["file"])
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+    # Memory-mapped (images, labels, histograms) of every chunk, in order
+    def chunks(self):
+        return [read_container(os.path.join(self.path, chunk["file"]), MAGIC, FORMAT_VERSION)[1]
+                for chunk in self.read_manifest()["chunks"] if chunk["samples"] > 0]
+
+    # All the samples, labels and histograms of the model, concatenated. Histograms are None unless every chunk has them
+    def load(self):
+        chunks = self.chunks()
+        if len(chunks) == 0:
+            return np.zeros((0, 64, 64), np.uint8), np.zeros(0, np.int32), None
+        histograms = None
+        if all("histograms" in chunk for chunk in chunks):
+            histograms = np.concatenate([chunk["histograms"] for chunk in chunks])
+        return (np.concatenate([chunk["images"] for chunk in chunks]),
+                np.concatenate([chunk["labels"] for chunk in chunks]),
+                histograms)
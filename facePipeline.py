@@ -0,0 +1,166 @@
+import Queue
+import threading
+import time
+
+"""
+Staged face capture pipeline.
+A capture thread prefetches camera frames, a pool of detection workers looks for faces in them and the consumer (the
+interaction loop, which also runs face recognition) receives the results. Stages are connected by bounded queues, so a
+slow consumer stalls the capture instead of piling up frames. Cosmetic side effects (LEDs) run in a fire-and-forget
+worker. Stage latencies and queue depths are recorded for inspection.
+"""
+
+DETECTION_WORKERS = 2
+QUEUE_SIZE = 4
+# Polling period of the blocking queue operations, so that stopping the pipeline is never delayed (seconds)
+POLLING = 0.05
+
+
+class StageStatistics:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.maximum = max(self.maximum, seconds)
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.total / max(self.count, 1), "max": self.maximum}
+
+
+class FacePipeline:
+    # capture: function returning a camera frame
+    # detector_factory: function returning a detection function (frame -> region of interest or None). Each worker
+    # builds its own, as detectors keep per-frame buffers
+    def __init__(self, capture, detector_factory, workers=DETECTION_WORKERS, queue_size=QUEUE_SIZE, copy_frames=True):
+        self.capture = capture
+        self.detector_factory = detector_factory
+        self.workers = max(workers, 1)
+        # Frames are copied when the capture function reuses its output buffer
+        self.copy_frames = copy_frames
+        self.frames = Queue.Queue(queue_size)
+        self.results = Queue.Queue(queue_size)
+        self.stopped = threading.Event()
+        self.threads = []
+        self.stages = {"capture": StageStatistics(), "detection": StageStatistics(), "consumer": StageStatistics()}
+        self.frame_depth = StageStatistics()
+        self.result_depth = StageStatistics()
+        self.start_time = None
+        self.stop_time = None
+
+    def start(self):
+        self.start_time = time.time()
+        self.threads = [threading.Thread(target=self.capture_loop, name="FaceCapture")]
+        self.threads += [threading.Thread(target=self.detection_loop, name="FaceDetection" + str(i))
+                         for i in range(self.workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    # Stops the stages and waits for them
+    def stop(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.stop_time = time.time()
+
+    # Puts an item in a queue, giving up if the pipeline is stopped. Returns False in that case
+    def put(self, queue, item):
+        while not self.stopped.is_set():
+            try:
+                queue.put(item, timeout=POLLING)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    # Gets an item from a queue, giving up if the pipeline is stopped. Returns None in that case
+    def get(self, queue):
+        while not self.stopped.is_set():
+            try:
+                return queue.get(timeout=POLLING)
+            except Queue.Empty:
+                pass
+        return None
+
+    def capture_loop(self):
+        while not self.stopped.is_set():
+            start = time.time()
+            frame = self.capture()
+            if self.copy_frames and frame is not None:
+                frame = frame.copy()
+            self.stages["capture"].add(time.time() - start)
+            self.frame_depth.add(self.frames.qsize())
+            if not self.put(self.frames, (start, frame)):
+                return
+
+    def detection_loop(self):
+        detect = self.detector_factory()
+        while not self.stopped.is_set():
+            item = self.get(self.frames)
+            if item is None:
+                return
+            captured, frame = item
+            start = time.time()
+            roi = detect(frame)
+            self.stages["detection"].add(time.time() - start)
+            self.result_depth.add(self.results.qsize())
+            if not self.put(self.results, (captured, frame, roi)):
+                return
+
+    # Yields (frame, region of interest or None) as soon as each frame has been processed. Frames processed by different
+    # workers may be slightly out of order
+    def __iter__(self):
+        while not self.stopped.is_set():
+            item = self.get(self.results)
+            if item is None:
+                return
+            captured, frame, roi = item
+            self.stages["consumer"].add(time.time() - captured)
+            yield frame, roi
+
+    # Stage latencies (capture and detection time, end-to-end latency at the consumer), mean queue depths and
+    # throughput in frames per second
+    def statistics(self):
+        elapsed = (self.stop_time or time.time()) - (self.start_time or time.time())
+        report = dict((stage, statistics.to_dict()) for stage, statistics in self.stages.items())
+        report["frame_queue"] = self.frame_depth.to_dict()
+        report["result_queue"] = self.result_depth.to_dict()
+        report["fps"] = self.stages["consumer"].count / elapsed if elapsed > 0 else 0.0
+        return report
+
+
+class SideEffects:
+    """ Fire-and-forget worker for cosmetic side effects, e.g. LED blinking
+    Submitted calls run in order on a background thread; when too many are pending new ones are dropped rather than
+    delaying the caller.
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.calls = Queue.Queue(queue_size)
+        self.worker = None
+        self.dropped = 0
+
+    def submit(self, function, *args, **kwargs):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.run, name="SideEffects")
+            self.worker.daemon = True
+            self.worker.start()
+        try:
+            self.calls.put_nowait((function, args, kwargs))
+        except Queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            function, args, kwargs = self.calls.get()
+            try:
+                function(*args, **kwargs)
+            except BaseException, err:
+                print "[ERROR] SideEffects: " + str(err)
@@ -1,7 +1,13 @@
+import Queue
+import atexit
 import os
+import threading
 
 import cv2
 
+from containerFile import replace_file
+from faceIndex import THRESHOLDS, FaceIndex, lbp_features
+from faceModelStore import FaceModelStore
 from trainingData import TrainingData
 
 MODEL_FILE = ".\\classifiers\\robotvision.yml"
@@ -11,15 +17,30 @@ Methods included in this file manage the face recognition algorithms.
 Selectable algorithms:  0: EigenFaces
                         1: FisherFaces
                         2: Local Binary Patterns Histograms (LBPH)
+                        3: LBPH histogram index (see faceIndex), vectorized nearest neighbour search for big galleries
 Recommended (and default) is LBPH, as it is the only one which supports updating. Other methods will need to run
 a new training with all the old samples plus the new ones.
 """
 
 ALGORITHM_NUMBER = 2
+# Distance above which a face is predicted as unknown (-1) by the OpenCV recognizers
+THRESHOLD = 100.0
+# Metric of the histogram index. Its threshold depends on the metric, see faceIndex.THRESHOLDS
+INDEX_METRIC = "chi2"
+# Vote margin of the leading label which ends a sequential recognition
+RECOGNITION_MARGIN = 1.5
 
 
-# Selects a model
-def model_initialize(model_number, withTreshold=False, threshold=100.0):
+# Default unknown face threshold of a model: the one of the index metric for the histogram index, THRESHOLD otherwise
+def default_threshold(model_number=None):
+    model_number = ALGORITHM_NUMBER if model_number is None else model_number
+    return THRESHOLDS[INDEX_METRIC] if model_number == 3 else THRESHOLD
+
+
+# Selects a model. The default threshold depends on the model
+def model_initialize(model_number, withTreshold=False, threshold=None):
+    if threshold is None:
+        threshold = default_threshold(model_number)
     if model_number == 0:
         if withTreshold:
             return cv2.face.createEigenFaceRecognizer(threshold=threshold)
@@ -35,6 +56,8 @@ def model_initialize(model_number, withTreshold=False, threshold=100.0):
             return cv2.face.createLBPHFaceRecognizer(threshold=threshold)
         else:
             return cv2.face.createLBPHFaceRecognizer()
+    elif model_number == 3:
+        return FaceIndex(metric=INDEX_METRIC, threshold=threshold if withTreshold else None)
     else:
         print "[ERROR] Invalid algorithm selected: " + str(ALGORITHM_NUMBER)
         quit()
@@ -51,46 +74,229 @@ def data_from_file(directory):
             img = cv2.imread(os.path.join(dir, file))
             gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
             gray_equ = cv2.equalizeHist(gray)
-            data.images.append(gray_equ)
-            data.labels.append(i)
+            data.append(gray_equ, i)
     return data
 
 
+# Face samples in the form expected by a model. The OpenCV recognizers take a list of images: the list holds views of
+# the samples array, so no image is copied
+def samples(model, images):
+    return images if isinstance(model, FaceIndex) else list(images)
+
+
+class RecognizerService:
+    """ Long-lived face recognizer
+    The model is loaded once and kept in memory, so predictions do not depend on the size of the model file. Training
+    replaces it with a new model atomically. Updates are applied in place under the same lock as the predictions, which
+    wait for them: the histogram index only holds the lock to add the histograms extracted beforehand, while the OpenCV
+    recognizers (which cannot be copied) hold it for the whole update. The face samples are persisted by a background
+    thread in a FaceModelStore: training replaces the stored model, updates only append the new samples, so the
+    interaction never waits for the disk.
+    Models saved by the previous versions in the YAML model file are still loaded and updated, rewriting the whole file.
+    """
+
+    def __init__(self, model_file=MODEL_FILE, algorithm=ALGORITHM_NUMBER, store=None):
+        self.model_file = model_file
+        self.algorithm = algorithm
+        self.store = FaceModelStore() if store is None else store
+        self.model = None
+        self.lock = threading.Lock()
+        # Persistence: queue of ("train" | "update", data) operations, consumed by the writer thread
+        self.operations = Queue.Queue()
+        self.writer = None
+        self.mirror = None      # Copy of a YAML model, updated and saved by the writer thread
+
+    # Loads the model, if it is not in memory yet
+    def get_model(self):
+        if self.model is None:
+            with self.lock:
+                if self.model is None:
+                    self.model = self.load_model(withTreshold=True)
+        return self.model
+
+    # Builds the model from the store or, if there is none, loads the YAML model file
+    def load_model(self, withTreshold):
+        model = model_initialize(self.algorithm, withTreshold=withTreshold)
+        if self.store.exists():
+            if isinstance(model, FaceIndex):
+                # Histograms stored with the samples are not extracted again
+                for chunk in self.store.chunks():
+                    if "histograms" in chunk:
+                        model.add_features(chunk["histograms"], chunk["labels"])
+                    else:
+                        model.add(chunk["images"], chunk["labels"])
+            else:
+                images, labels, histograms = self.store.load()
+                model.train(samples(model, images), labels)
+            return model
+        if not os.path.isfile(self.model_file):
+            print "[ERROR] RecognizerService: model file not found: " + self.model_file
+            quit(-1)
+        model.load(self.model_file)
+        return model
+
+    # Discards the model in memory: the next prediction loads it again. Used when the stored model is replaced
+    def reload(self):
+        self.flush()
+        with self.lock:
+            self.model = None
+        self.mirror = None
+
+    # Returns the predicted label and its confidence (distance, the lower the better). -1 for unknown faces
+    def predict(self, frame):
+        self.get_model()
+        with self.lock:
+            [predicted_label, predicted_confidence] = self.model.predict(frame)
+        return predicted_label, predicted_confidence
+
+    # Predicts a batch of frames, e.g. all the faces of a frame, with a single acquisition of the model
+    def predict_batch(self, frames):
+        self.get_model()
+        with self.lock:
+            model = self.model
+            return [tuple(model.predict(frame)) for frame in frames]
+
+    # Trains a new model and swaps it with the current one
+    def train(self, data):
+        model = model_initialize(self.algorithm, withTreshold=True)
+        model.train(samples(model, data.images), data.labels)
+        with self.lock:
+            self.model = model
+        # The histograms of the index are stored with the samples, so that loading it does not extract them again
+        self.persist("train", data, model.features[:model.size].copy() if isinstance(model, FaceIndex) else None)
+
+    # Updates the model with new training data. Predictions are blocked during the update, see the class documentation
+    def update(self, new_data):
+        model = self.get_model()
+        histograms = None
+        if isinstance(model, FaceIndex):
+            histograms = lbp_features(new_data.images, model.grid)
+            with self.lock:
+                self.model.add_features(histograms, new_data.labels)
+        else:
+            with self.lock:
+                self.model.update(samples(self.model, new_data.images), new_data.labels)
+        self.persist("update", new_data, histograms)
+
+    # Queues an operation for the writer thread, starting it if needed. Histograms are only given for the histogram
+    # index: the OpenCV recognizers do not use them
+    def persist(self, operation, data, histograms=None):
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.write_loop, name="RecognizerWriter")
+            self.writer.daemon = True
+            self.writer.start()
+            atexit.register(self.flush)
+        # The samples may be views of a TrainingData which changes before the writer stores them: they are copied
+        self.operations.put((operation, data.copy(), histograms))
+
+    # Writer thread: applies the operations to the store. A failed operation is reported and skipped
+    def write_loop(self):
+        while True:
+            operation, data, histograms = self.operations.get()
+            try:
+                if operation == "train":
+                    self.store.reset(data.images, data.labels, histograms)
+                    self.mirror = None
+                elif self.store.exists() or not os.path.isfile(self.model_file):
+                    self.store.append(data.images, data.labels, histograms)
+                else:
+                    # The samples of a YAML model are unknown: it is updated and saved as a whole
+                    if self.mirror is None:
+                        self.mirror = self.load_model(withTreshold=False)
+                    self.mirror.update(samples(self.mirror, data.images), data.labels)
+                    if self.operations.empty():
+                        self.save(self.mirror)
+            except BaseException, err:
+                # The writer keeps serving the queue, so that flush never waits for an operation which will not run
+                print "[ERROR] RecognizerService: " + str(err)
+            finally:
+                self.operations.task_done()
+
+    # Saves a YAML model atomically: OpenCV writes a temporary file, which replaces the previous model
+    def save(self, model):
+        root, extension = os.path.splitext(self.model_file)
+        temporary = root + ".tmp" + extension
+        model.save(temporary)
+        replace_file(temporary, self.model_file)
+
+    # Waits until the stored model is up to date
+    def flush(self):
+        if self.writer is not None:
+            self.operations.join()
+
+
+# Recognizer shared by the recognition functions
+recognizer = RecognizerService()
+
+
+# Returns the shared recognizer
+def get_recognizer():
+    return recognizer
+
+
 # Trains the face recognition module using the selected model. Saves is for future use.
 def recognition_train(data):
     if isinstance(data, TrainingData):
-        model = model_initialize(ALGORITHM_NUMBER, withTreshold=False)
-        model.train(data.images, data.labels)
-        # Cleares up previous models
-        if os.path.exists(MODEL_FILE):
-            os.remove(MODEL_FILE)
-        model.save(MODEL_FILE)
+        recognizer.train(data)
     else:
         print "[ERROR] recognition_train: input is not a TrainingData instance."
         quit(-1)
 
 
-# Loads the selected model and does a prediction.
+# Does a prediction with the model in memory.
 # Threshold regulates the unknown informant detection
 # I assume frame is already been cropped, resized and converted to greyscale
 def recognition_predict(frame):
-    model = model_initialize(ALGORITHM_NUMBER, withTreshold=True)
-    model.load(MODEL_FILE)
-    [predicted_label, predicted_confidence] = model.predict(frame)
+    predicted_label, predicted_confidence = recognizer.predict(frame)
     # Returns class name
     return predicted_label
 
 
+# Does a prediction with the model in memory. Returns the label and its confidence (distance, the lower the better)
+def recognition_predict_confidence(frame):
+    return recognizer.predict(frame)
+
+
+# Does a prediction for each frame of a list. Returns a list of (label, confidence)
+def recognition_predict_batch(frames):
+    return recognizer.predict_batch(frames)
+
+
+# Confidence-weighted votes of a sequence of predictions
+class SequentialVote:
+    # threshold: distance of the unknown faces, by default the one of the selected algorithm (see default_threshold)
+    def __init__(self, threshold=None):
+        self.threshold = default_threshold() if threshold is None else threshold
+        self.votes = dict()     # label -> accumulated weight. -1 is the unknown informant
+        self.frames = 0
+
+    # Weight of a prediction: from 1 for a perfect match down to 0.5 at the threshold. Unknown faces count 1
+    def weight(self, label, confidence):
+        if label < 0 or confidence >= self.threshold:
+            return 1.0
+        return 1.0 - 0.5 * confidence / self.threshold
+
+    def add(self, label, confidence):
+        self.votes[label] = self.votes.get(label, 0.0) + self.weight(label, confidence)
+        self.frames += 1
+
+    # Leading label and its margin over the second one. Ties go to the known informant with the lowest label
+    def leader(self):
+        if len(self.votes) == 0:
+            return None, 0.0
+        ranking = sorted(self.votes.items(), key=lambda item: (-item[1], item[0] < 0, item[0]))
+        second = ranking[1][1] if len(ranking) > 1 else 0.0
+        return ranking[0][0], ranking[0][1] - second
+
+    # True when the leading label is ahead of the others by margin
+    def decided(self, margin=RECOGNITION_MARGIN):
+        return self.leader()[1] >= margin
+
+
 # Updates the model with new training data
 def recognition_update(new_data):
     if isinstance(new_data, TrainingData):
-        model = model_initialize(ALGORITHM_NUMBER, withTreshold=False)
-        model.load(MODEL_FILE)
-        model.update(new_data.images, new_data.labels)
-        # Cleares up previous models
-        if os.path.exists(MODEL_FILE):
-            os.remove(MODEL_FILE)
-        model.save(MODEL_FILE)
+        recognizer.update(new_data)
     else:
         print "[ERROR] recognition_update: input is not a TrainingData instance."
         quit(-1)
@@ -0,0 +1,325 @@
+import argparse
+import itertools
+import json
+import random
+from multiprocessing import Pool
+
+import numpy as np
+
+from Vanderbilt import Vanderbilt
+from simulatedRobot import SimulatedRobot
+
+"""
+Headless Monte Carlo simulation of the Vanderbilt experiment.
+The whole protocol (familiarization, decision making, belief estimation, unknown informants with episodic memory) is run
+against scripted informants, without cameras, speech or pauses. Sessions are spread over a process pool and their
+trust-learning curves are averaged.
+"""
+
+INFORMANT_KINDS = ["helper", "tricker", "noisy", "drifting"]
+
+
+class ScriptedInformant:
+    # kind: "helper" always tells the truth, "tricker" always lies, "noisy" is a helper which lies with probability
+    # noise, "drifting" is a helper which turns into a tricker from the switch_trial-th hint on
+    def __init__(self, kind="helper", noise=0.2, switch_trial=10, random_state=None):
+        if kind not in INFORMANT_KINDS:
+            print "[ERROR] ScriptedInformant. Invalid kind of informant: " + str(kind)
+            quit(-1)
+        self.kind = kind
+        self.noise = noise
+        self.switch_trial = switch_trial
+        self.random_state = np.random if random_state is None else random_state
+        self.trials = 0
+
+    # Returns True if the informant is going to lie in the current trial
+    def lies(self):
+        if self.kind == "helper":
+            return False
+        if self.kind == "tricker":
+            return True
+        if self.kind == "noisy":
+            return self.random_state.random_sample() < self.noise
+        return self.trials >= self.switch_trial
+
+    # Suggests a side, knowing where the sticker is
+    def hint(self, sticker_side):
+        lie = self.lies()
+        self.trials += 1
+        if lie:
+            return 'B' if sticker_side == 'A' else 'A'
+        return sticker_side
+
+    # The most likely hint of the current trial, without giving it: no trial is counted and nothing is drawn
+    def expected_hint(self, sticker_side):
+        if self.kind == "noisy":
+            lie = self.noise > 0.5
+        elif self.kind == "drifting":
+            lie = self.trials >= self.switch_trial
+        else:
+            lie = self.kind == "tricker"
+        if lie:
+            return 'B' if sticker_side == 'A' else 'A'
+        return sticker_side
+
+
+class HeadlessRobot(SimulatedRobot):
+    def __init__(self, informants):
+        # Nothing is read from or written to disk: time and beliefs only live in memory
+        self.IP = None
+        self.PORT = None
+        self.training_data = None
+        self.informants = 0
+        self.beliefs = []
+        self.population = None
+        self.episode_log = None
+        self.time = 0
+        self.clock = None
+        self.landmark_position = 'A'
+        self.scripted_informants = informants
+        self.present = 0        # Index of the scripted informant in front of the robot
+        self.labels = dict()    # Scripted informant index -> face label
+
+    # The informant in front of the robot
+    def meet(self, informant):
+        self.present = informant
+
+    def load_time(self):
+        self.time = 0
+
+    def reset_time(self):
+        self.time = 0
+
+    def get_and_inc_time(self):
+        previous_time = self.time
+        self.time += 1
+        return previous_time
+
+    def say(self, words):
+        pass
+
+    def set_face_tracking(self, enabled, face_width=0.5):
+        pass
+
+    def set_led_color(self, color, speed=0.5):
+        pass
+
+    def look_A(self):
+        pass
+
+    def look_B(self):
+        pass
+
+    def look_forward(self):
+        pass
+
+    def standup(self):
+        pass
+
+    def sitdown(self):
+        pass
+
+    def save_beliefs(self):
+        pass
+
+    def save_time(self):
+        pass
+
+    # Faces are never captured: the present informant receives the next label
+    def acquire_examples(self, number_of_frames, informant_number):
+        self.labels[self.present] = informant_number
+        self.informants += 1
+
+    def face_learning(self):
+        pass
+
+    # Recognition is always correct, and unknown informants get their episodic memory
+    def face_recognition(self, number_of_frames=5, announce=True):
+        if self.present not in self.labels:
+            self.manage_unknown_informant(None)
+            self.labels[self.present] = self.informants - 1
+        return self.labels[self.present]
+
+    def manage_unknown_informant(self, frames):
+        self.add_episodic_belief()
+
+    def look_for_landmark(self, side):
+        return side == self.landmark_position
+
+    def listen_for_side(self, vocabulary):
+        return self.scripted_informants[self.present].hint(self.landmark_position)
+
+    # Only yes / no questions are asked outside of the scripted phases: the answer is always no
+    def listen_for_words(self, vocabulary):
+        return "no" if "no" in vocabulary else vocabulary[0]
+
+
+class HeadlessVanderbilt(Vanderbilt):
+    def __init__(self, robot, demo_number=6, mature=True, withUpdate=False, random_state=None, half_life=None,
+                 window=None):
+        Vanderbilt.__init__(self, demo_number=demo_number, mature=mature, simulation=True, withUpdate=withUpdate,
+                            robot=robot, half_life=half_life, window=window)
+        self.verbose = False
+        self.random_state = np.random if random_state is None else random_state
+
+    def wait(self, seconds):
+        pass
+
+    # The sticker is moved at random
+    def relocate_sticker(self):
+        self.robot.set_landmark_position("left" if self.random_state.random_sample() < 0.5 else "right")
+
+
+# Parameters of a batch of simulated sessions
+class SessionConfig:
+    def __init__(self, known=("helper", "tricker"), unknown=(), demo_number=6, mature=True, withUpdate=True,
+                 decision_trials=20, estimation_trials=10, noise=0.2, switch_trial=10, half_life=None, window=None):
+        self.known = list(known)            # Kinds of the informants met during familiarization
+        self.unknown = list(unknown)        # Kinds of the informants first met during decision making
+        self.demo_number = demo_number
+        self.mature = mature
+        self.withUpdate = withUpdate
+        self.decision_trials = decision_trials
+        self.estimation_trials = estimation_trials
+        self.noise = noise
+        self.switch_trial = switch_trial
+        self.half_life = half_life
+        self.window = window
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+# Runs a whole session. Informants take turns in a round robin.
+# Returns the curves of the session: sticker found in each decision making trial, reliability of each informant after each
+# trial and correctness of the predicted informant action in each belief estimation trial
+def run_session(config, seed):
+    random.seed(seed)
+    np.random.seed(seed % (2 ** 32))
+    random_state = np.random.RandomState(seed % (2 ** 32))
+    kinds = config.known + config.unknown
+    informants = [ScriptedInformant(kind, config.noise, config.switch_trial, random_state) for kind in kinds]
+    robot = HeadlessRobot(informants)
+    experiment = HeadlessVanderbilt(robot, config.demo_number, config.mature, config.withUpdate, random_state,
+                                    config.half_life, config.window)
+    # Familiarization
+    for i in range(len(config.known)):
+        robot.meet(i)
+        experiment.demonstration(i)
+    robot.face_learning()
+    # Decision making
+    found = np.zeros(config.decision_trials)
+    reliability = np.zeros((config.decision_trials, len(kinds)))
+    for trial in range(config.decision_trials):
+        robot.meet(trial % len(kinds))
+        choice, found[trial] = experiment.decision_making(withUpdate=config.withUpdate)
+        for i in range(len(kinds)):
+            reliability[trial, i] = robot.beliefs[robot.labels[i]].get_reliability() if i in robot.labels else np.nan
+    # Belief estimation
+    predicted = np.zeros(config.estimation_trials)
+    for trial in range(config.estimation_trials):
+        informant = trial % len(kinds)
+        robot.meet(informant)
+        # Belief estimation relocates the sticker itself, so the prediction is checked afterwards. The informant does not
+        # point during belief estimation: its expected hint is used, so its state and the random draws are unchanged
+        informant_belief, informant_action = experiment.belief_estimation()
+        expected = informants[informant].expected_hint(robot.landmark_position)
+        predicted[trial] = informant_action == expected
+    return found, reliability, predicted
+
+
+# Runs a chunk of sessions in a worker process and returns their sums, to keep inter-process traffic low.
+# Sessions which abort (e.g. not enough samples to generate an episodic memory) are counted apart
+def run_chunk(arguments):
+    config, seeds = arguments
+    kinds = len(config.known) + len(config.unknown)
+    found = np.zeros(config.decision_trials)
+    reliability = np.zeros((config.decision_trials, kinds))
+    reliability_count = np.zeros((config.decision_trials, kinds))
+    predicted = np.zeros(config.estimation_trials)
+    completed = 0
+    aborted = 0
+    for seed in seeds:
+        try:
+            session_found, session_reliability, session_predicted = run_session(config, seed)
+        except SystemExit:
+            aborted += 1
+            continue
+        found += session_found
+        reliability += np.nan_to_num(session_reliability)
+        reliability_count += ~np.isnan(session_reliability)
+        predicted += session_predicted
+        completed += 1
+    return found, reliability, reliability_count, predicted, completed, aborted
+
+
+# Runs many sessions over a process pool and averages their trust-learning curves
+def run_monte_carlo(config, sessions, processes=None, chunk_size=1000, seed=0):
+    chunks = [(config, range(seed + start, seed + min(start + chunk_size, sessions)))
+              for start in range(0, sessions, chunk_size)]
+    kinds = len(config.known) + len(config.unknown)
+    found = np.zeros(config.decision_trials)
+    reliability = np.zeros((config.decision_trials, kinds))
+    reliability_count = np.zeros((config.decision_trials, kinds))
+    predicted = np.zeros(config.estimation_trials)
+    completed = 0
+    aborted = 0
+    pool = Pool(processes=processes)
+    try:
+        for result in pool.imap_unordered(run_chunk, chunks):
+            found += result[0]
+            reliability += result[1]
+            reliability_count += result[2]
+            predicted += result[3]
+            completed += result[4]
+            aborted += result[5]
+    finally:
+        pool.close()
+        pool.join()
+    completed_sessions = max(completed, 1)
+    return {
+        "config": config.to_dict(),
+        "sessions": completed,
+        "aborted": aborted,
+        "decision_accuracy": (found / completed_sessions).tolist(),
+        "reliability": (reliability / np.maximum(reliability_count, 1)).tolist(),
+        "estimation_accuracy": (predicted / completed_sessions).tolist()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Monte Carlo simulation of the Vanderbilt experiment")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--known", nargs="+", default=["helper", "tricker"], choices=INFORMANT_KINDS)
+    parser.add_argument("--unknown", nargs="*", default=[], choices=INFORMANT_KINDS)
+    parser.add_argument("--demo-number", type=int, nargs="+", default=[6])
+    parser.add_argument("--with-update", type=int, nargs="+", default=[1], choices=[0, 1])
+    parser.add_argument("--immature", action="store_true")
+    parser.add_argument("--decision-trials", type=int, default=20)
+    parser.add_argument("--estimation-trials", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.2)
+    parser.add_argument("--switch-trial", type=int, default=10)
+    parser.add_argument("--half-life", type=float, default=None, help="exponential forgetting of the beliefs")
+    parser.add_argument("--window", type=int, default=None, help="sliding window forgetting of the beliefs")
+    parser.add_argument("--output", help="JSON file where the curves are written")
+    args = parser.parse_args()
+    reports = []
+    # Every combination of the swept parameters
+    for demo_number, with_update in itertools.product(args.demo_number, args.with_update):
+        config = SessionConfig(args.known, args.unknown, demo_number, not args.immature, bool(with_update),
+                               args.decision_trials, args.estimation_trials, args.noise, args.switch_trial,
+                               args.half_life, args.window)
+        report = run_monte_carlo(config, args.sessions, args.processes)
+        print "[SIMULATION] demo_number=" + str(demo_number) + ", withUpdate=" + str(bool(with_update)) + \
+              ": decision accuracy " + str(round(np.mean(report["decision_accuracy"]), 3)) + \
+              ", estimation accuracy " + str(round(np.mean(report["estimation_accuracy"]), 3)) + \
+              ", aborted sessions " + str(report["aborted"])
+        reports.append(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
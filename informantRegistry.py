@@ -0,0 +1,192 @@
+import os
+from collections import OrderedDict
+
+from bayesianNetwork import BeliefNetwork
+from beliefLoader import LazyBeliefNetwork
+from containerFile import read_container, write_container
+from episodeDataset import EpisodeDataset
+
+"""
+Registry of the informants' beliefs, indexed by face label.
+Only the most recently used networks are kept in memory: the coldest ones are evicted to disk (count tables, episodes and
+forgetting settings) and transparently reloaded the next time their label is accessed. The registry behaves like the
+list of beliefs it replaces (len, indexing, iteration, append).
+"""
+
+# Default number of networks kept in memory
+HOT_BELIEFS = 64
+EVICTION_PATH = ".\\datasets\\evicted\\"
+MAGIC = "VBBELF"
+FORMAT_VERSION = 1
+COUNT_TABLES = ["Xi", "Xr", "Yi", "Yr", "pdf_counts"]
+
+
+# Writes a belief network in a container file
+def save_belief(bn, filename):
+    counts = bn.dataset.get_counts()
+    dataset = bn.get_episode_dataset()
+    arrays = dict((table, counts[table]) for table in COUNT_TABLES)
+    arrays["codes"] = dataset.codes
+    arrays["times"] = dataset.times
+    metadata = {
+        "name": bn.name,
+        "engine": bn.engine,
+        "half_life": bn.half_life,
+        "window": bn.window,
+        "reference_time": None if counts["reference_time"] is None else int(counts["reference_time"])
+    }
+    write_container(filename, metadata, arrays, MAGIC, FORMAT_VERSION)
+
+
+# Reads a belief network written by save_belief, without parsing its episodes again
+def load_belief(filename):
+    metadata, arrays = read_container(filename, MAGIC, FORMAT_VERSION)
+    counts = dict((table, arrays[table]) for table in COUNT_TABLES)
+    counts["reference_time"] = metadata["reference_time"]
+    return BeliefNetwork(metadata["name"], EpisodeDataset(arrays["codes"], arrays["times"]), engine=metadata["engine"],
+                         half_life=metadata["half_life"], window=metadata["window"], counts=counts)
+
+
+class InformantRegistry(object):
+    def __init__(self, beliefs=(), capacity=HOT_BELIEFS, path=EVICTION_PATH):
+        self.capacity = capacity    # Maximum number of networks in memory, None for unbounded
+        self.path = path
+        self.names = []
+        self.hot = OrderedDict()    # label -> network, from the least to the most recently used
+        self.cold = dict()          # label -> file of the evicted network, or the proxy of a network never built
+        # Population rows of the evicted networks, to bind them again on reload: label -> (population, index)
+        self.rows = dict()
+        # Version of the networks reloaded from disk, whose file is still up to date as long as it does not change
+        self.loaded_versions = dict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+        for bn in beliefs:
+            self.append(bn)
+
+    # Adds the network of a new informant and returns its label
+    def append(self, bn):
+        label = len(self.names)
+        self.names.append(bn.name)
+        self.hot[label] = bn
+        self.evict_cold()
+        return label
+
+    # Label of an informant given the name of its network
+    def label_of(self, name):
+        return self.names.index(name)
+
+    # Network of a label, reloading it if it was evicted. Slices return lists
+    # A network stays live until capacity other networks have been accessed: it must not be kept across accesses, since
+    # it may be evicted and reloaded as a new object in the meantime
+    def __getitem__(self, label):
+        if isinstance(label, slice):
+            return [self[i] for i in range(*label.indices(len(self)))]
+        label = self.check_label(label)
+        bn = self.hot.pop(label, None)
+        if bn is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            bn = self.reload(label)
+        self.hot[label] = bn
+        self.evict_cold()
+        return bn
+
+    # Replaces the network of a label
+    def __setitem__(self, label, bn):
+        label = self.check_label(label)
+        self.forget(label)
+        self.hot.pop(label, None)
+        self.names[label] = bn.name
+        self.hot[label] = bn
+        self.evict_cold()
+
+    def __len__(self):
+        return len(self.names)
+
+    # Iterates over all the networks in label order. Each one is the live network, reloaded if it was evicted, so
+    # changes made during the iteration are kept: a network may be evicted again (and written) once the scan moves on
+    def __iter__(self):
+        for label in range(len(self.names)):
+            yield self[label]
+
+    def check_label(self, label):
+        if label < 0:
+            label += len(self.names)
+        if not 0 <= label < len(self.names):
+            raise IndexError("InformantRegistry label out of range")
+        return label
+
+    # Evicts the least recently used networks until the capacity is respected
+    def evict_cold(self):
+        while self.capacity is not None and len(self.hot) > max(self.capacity, 1):
+            label, bn = self.hot.popitem(last=False)
+            self.evict(label, bn)
+
+    # Moves a network to disk
+    def evict(self, label, bn):
+        self.evictions += 1
+        # A proxy which has never been built is already cheap: it stays as it is
+        if isinstance(bn, LazyBeliefNetwork) and bn.network is None:
+            self.cold[label] = bn
+            return
+        filename = self.file_of(label)
+        if self.loaded_versions.get(label) != bn.version or not os.path.isfile(filename):
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            save_belief(bn, filename)
+            self.writes += 1
+        self.loaded_versions.pop(label, None)
+        # The population keeps the counts of the row, but not the evicted network
+        parser = bn.dataset
+        if parser.population is not None:
+            self.rows[label] = (parser.population, parser.population_index)
+            parser.population.release(parser.population_index)
+        self.cold[label] = filename
+
+    # Loads an evicted network, binding it again to its population row
+    # The file is kept: if the network does not change, evicting it again costs no write
+    def reload(self, label):
+        bn = self.peek(label)
+        del self.cold[label]
+        if isinstance(bn, LazyBeliefNetwork):
+            return bn
+        self.loaded_versions[label] = bn.version
+        if label in self.rows:
+            population, index = self.rows.pop(label)
+            population.bind(bn.dataset, index)
+        return bn
+
+    # Loads an evicted network without changing the state of the registry
+    def peek(self, label):
+        source = self.cold[label]
+        if isinstance(source, LazyBeliefNetwork):
+            return source
+        return load_belief(source)
+
+    # Removes the file of a network
+    def forget(self, label):
+        self.cold.pop(label, None)
+        self.rows.pop(label, None)
+        self.loaded_versions.pop(label, None)
+        if os.path.isfile(self.file_of(label)):
+            os.remove(self.file_of(label))
+
+    def file_of(self, label):
+        return os.path.join(self.path, self.names[label] + ".belief")
+
+    # Removes every network, then adds the given ones
+    def reset(self, beliefs=()):
+        for label in range(len(self.names)):
+            self.forget(label)
+        self.names = []
+        self.hot = OrderedDict()
+        for bn in beliefs:
+            self.append(bn)
+
+    # Hit / miss / eviction counters
+    def statistics(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "writes": self.writes,
+                "hot": len(self.hot), "cold": len(self.cold)}
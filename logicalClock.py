@@ -0,0 +1,156 @@
+import binascii
+import os
+import time
+
+"""
+This class manages the persistent logical clock used to timestamp the episodes.
+Time values are leased from the clock file in blocks: the file always holds the first value that has not been handed out
+yet, so it is only rewritten once per block instead of once per tick. Writes are atomic (write a temporary file, then
+rename it) and leases are taken under a lock file, so concurrent sessions never share a value and a crash can only skip
+the unused part of a block, never duplicate a timestamp.
+"""
+
+TIME_FILE = "current_time.csv"
+# Default number of time values leased with every write
+BLOCK_SIZE = 32
+# Lock acquisition: polling period, and age after which a lock left by a crashed session is broken (seconds)
+LOCK_POLLING = 0.01
+LOCK_EXPIRATION = 10.0
+
+
+class LogicalClock:
+    def __init__(self, filename=TIME_FILE, block_size=BLOCK_SIZE):
+        self.filename = filename
+        # Flush policy: 1 writes the file on every tick, bigger blocks write it once every block_size ticks
+        self.block_size = max(int(block_size), 1)
+        self.next_value = None     # Next value to be handed out
+        self.limit = None          # End (excluded) of the leased block
+        self.token = None          # Owner token written in the lock file while the lock is held
+
+    # Current time value, i.e. the next one to be handed out. Does not lease anything
+    def peek(self):
+        if self.next_value is not None and self.next_value < self.limit:
+            return self.next_value
+        return self.read()
+
+    # Returns a new time value, leasing a new block when needed
+    def tick(self):
+        return self.tick_range(1)[0]
+
+    # Returns n consecutive new time values
+    def tick_range(self, n):
+        if self.next_value is None or self.next_value + n > self.limit:
+            self.lease(max(n, self.block_size))
+        values = range(self.next_value, self.next_value + n)
+        self.next_value += n
+        return values
+
+    # Leases a block of n values from the file
+    def lease(self, n):
+        self.lock()
+        try:
+            start = self.read()
+            self.write(start + n)
+        finally:
+            self.unlock()
+        self.next_value = start
+        self.limit = start + n
+
+    # Gives back the unused part of the block, if no other session leased values in the meantime. To be called when
+    # a session ends cleanly, so that time restarts from the next value instead of the end of the block
+    def flush(self):
+        if self.next_value is None or self.next_value == self.limit:
+            return
+        self.lock()
+        try:
+            if self.read() == self.limit:
+                self.write(self.next_value)
+                self.limit = self.next_value
+        finally:
+            self.unlock()
+
+    # Moves the clock forward to a value, if it is behind it. Used when restoring a saved state
+    def advance(self, value):
+        self.lock()
+        try:
+            if self.read() < value:
+                self.write(value)
+        finally:
+            self.unlock()
+        self.next_value = None
+        self.limit = None
+
+    # Restarts the clock from zero
+    def reset(self):
+        self.lock()
+        try:
+            self.write(0)
+        finally:
+            self.unlock()
+        self.next_value = None
+        self.limit = None
+
+    # Reads the value stored in the file. A temporary file left by an interrupted write is considered too
+    def read(self):
+        value = 0
+        for filename in [self.filename, self.temporary_file()]:
+            if os.path.isfile(filename):
+                with open(filename, 'r') as f:
+                    line = f.readline().strip()
+                if line.isdigit():
+                    value = max(value, int(line))
+        return value
+
+    # Writes a value atomically
+    def write(self, value):
+        temporary = self.temporary_file()
+        with open(temporary, 'w') as f:
+            f.write(str(value))
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.rename(temporary, self.filename)
+        except OSError:
+            # Windows does not rename over an existing file. Until the rename, read() falls back to the temporary file
+            os.remove(self.filename)
+            os.rename(temporary, self.filename)
+
+    def temporary_file(self):
+        return self.filename + ".tmp"
+
+    def lock_file(self):
+        return self.filename + ".lock"
+
+    # Acquires the inter-process lock. The lock file holds an owner token (process id and a random value), so that a lock
+    # broken by another session after LOCK_EXPIRATION is not released by this one
+    def lock(self):
+        token = str(os.getpid()) + "-" + binascii.hexlify(os.urandom(8))
+        while True:
+            try:
+                descriptor = os.open(self.lock_file(), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                try:
+                    os.write(descriptor, token)
+                finally:
+                    os.close(descriptor)
+                self.token = token
+                return
+            except OSError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_file()) > LOCK_EXPIRATION:
+                        os.remove(self.lock_file())
+                        continue
+                except OSError:
+                    # The lock has just been released
+                    continue
+                time.sleep(LOCK_POLLING)
+
+    # Releases the inter-process lock, only if it is still owned by this session
+    def unlock(self):
+        token, self.token = self.token, None
+        try:
+            with open(self.lock_file(), 'r') as f:
+                owner = f.read()
+        except IOError:
+            return
+        if owner == token:
+            os.remove(self.lock_file())
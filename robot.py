@@ -1,6 +1,20 @@
-import qi
+# NAOqi is only needed by the physical robot: simulated and headless robots can run without it
+try:
+    import qi
+except ImportError:
+    qi = None
 
 from bayesianNetwork import BeliefNetwork
+from captureArchive import CaptureArchive
+from cameraFrame import FrameConverter
+from beliefLoader import BeliefLoader, LazyBeliefNetwork
+from episodeLog import EpisodeLog
+from facePipeline import DETECTION_WORKERS, FacePipeline, SideEffects
+from informantRegistry import InformantRegistry
+from logicalClock import LogicalClock
+from robotSnapshot import SNAPSHOT_FILE, save_snapshot, load_snapshot
+from trainingData import SAMPLES_FILE, TrainingData
+from trustPopulation import TrustPopulation
 from faceDetection import *
 from faceRecognition import *
 
@@ -17,6 +31,9 @@ class Robot:
     def __init__(self, ip="nao.local", port=9559):
         self.IP = ip
         self.PORT = port
+        if qi is None:
+            print "[ERROR] Robot: the qi module is required to connect to a physical robot."
+            quit(-1)
         self.session = qi.Session()
         try:
             self.session.connect("tcp://" + self.IP + ":" + str(self.PORT))
@@ -27,18 +44,30 @@ class Robot:
         self.camera_name_id = None
         self.cam_h = None
         self.cam_w = None
+        self.frame_converter = FrameConverter()
+        # Full-frame detection, as the regions of interest given to recognition must not change. Tracking and downscaling
+        # are opt-in (FaceDetector(tracking=True, downscale=0.5)), once checked with benchmarks/detectionBenchmark.py
+        self.face_detector = FaceDetector()
+        # Face capture pipeline: detection workers, LED side effects and statistics of the last capture
+        self.detection_workers = DETECTION_WORKERS
+        self.side_effects = SideEffects()
+        self.capture_statistics = None
         self.tts_service = None
         self.motion_service = None
         self.posture_service = None
         self.tracker_service = None
         self.led_service = None
-        self.training_data = TrainingData()
+        self.training_data = TrainingData(filename=SAMPLES_FILE)
+        self.capture_archive = CaptureArchive()
         self.informants = 0
-        self.beliefs = []
+        self.beliefs = InformantRegistry()
+        self.population = None
+        self.episode_log = EpisodeLog()
         self.landmark_service = None
         self.memory_service = None
         self.speech_service = None
         self.time = None
+        self.clock = None
         self.load_time()
         self.animation_service = None
         self.audio_service = None
@@ -125,8 +154,8 @@ class Robot:
         self.video_service.unsubscribe(self.camera_name_id)
 
     # Captures a single image frame from the cameras
+    # The frame is converted into a buffer reused by the next capture: copy it to keep it
     def get_camera_image(self):
-        image = np.zeros((self.cam_h, self.cam_w, 3), np.uint8)
         # Gets the raw image
         result = self.video_service.getImageRemote(self.camera_name_id)
         if result is None:
@@ -134,87 +163,131 @@ class Robot:
         elif result[6] is None:
             print 'no image data string.'
         else:
-            # Translates the value to mat
-            values = map(ord, list(str(result[6])))
-            i = 0
-            for y in range(0, self.cam_h):
-                for x in range(0, self.cam_w):
-                    image.itemset((y, x, 0), values[i + 0])
-                    image.itemset((y, x, 1), values[i + 1])
-                    image.itemset((y, x, 2), values[i + 2])
-                    i += 3
-        return image
+            # Wraps the raw data without copying it and converts it to a BGR mat
+            return self.frame_converter.convert(result)
+        return np.zeros((self.cam_h, self.cam_w, 3), np.uint8)
 
     # If image contains a face, it retrieves the cropped region of interest
     def detect_face(self, image, grayscale=True):
-        roi = facial_detection(image, grayscale=grayscale)
+        roi = self.face_detector.detect(image, grayscale=grayscale)
         return False if roi is None else True, roi
 
-    # Captures a certain amount of face frames
-    def collect_face_frames(self, number):
-        face_frames = []
-        self.video_service_subscribe()
-        self.set_face_tracking(True)    # If should be on by default, but it re-enables is for debugging purposes
+    # Captures face frames one at a time, up to a certain amount. Stopping the iteration early releases the camera.
+    # Capture and detection run in a pipeline (see FacePipeline), while the caller consumes the detected faces.
+    # With group=None the biggest face of each frame is returned. Otherwise every face of the frame is returned, as a
+    # list of (rectangle, face) from left to right, and only frames with exactly group faces count (any number if 0)
+    def face_frames(self, number, group=None):
+        self.start_capture()
+        pipeline = FacePipeline(self.get_camera_image, lambda: self.detector_factory(group is not None),
+                                workers=self.detection_workers)
+        pipeline.start()
         found_faces = 0
         undetected_frames = 0
-        while found_faces < number:
-            image = self.get_camera_image()
-            detected, roi = self.detect_face(image)
-            if detected:
-                # Blinking effect on face detection
-                self.set_led_color("green", speed=0.2)
-                self.set_led_color("white", speed=0.2)
-                found_faces += 1
-                face_frames.append(roi)
-                undetected_frames = 0
-            else:
-                undetected_frames += 1
-                if undetected_frames % 10 == 0:
-                    self.say("I can't see you well. Can you please move closer?")
-            cv2.putText(image, str("Detected: " + str(found_faces) + " / " + str(number)),
-                        (0, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
-            cv2.imshow("Robot Eyes", image)
-            cv2.waitKey(1)
+        try:
+            for image, roi in pipeline:
+                detected = roi is not None and (not group or len(roi) == group)
+                if detected:
+                    self.face_detected_feedback()
+                    found_faces += 1
+                    undetected_frames = 0
+                else:
+                    undetected_frames += 1
+                    self.undetected_feedback(undetected_frames)
+                if image is not None:
+                    cv2.putText(image, str("Detected: " + str(found_faces) + " / " + str(number)),
+                                (0, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
+                    cv2.imshow("Robot Eyes", image)
+                    cv2.waitKey(1)
+                if detected:
+                    yield roi
+                if found_faces >= number:
+                    break
+        finally:
+            pipeline.stop()
+            self.capture_statistics = pipeline.statistics()
+            self.stop_capture()
+
+    # Detection function of a pipeline worker: each worker has its own detector, configured as the robot's one.
+    # Frames without faces give None
+    def detector_factory(self, multiple=False):
+        detector = self.face_detector.clone()
+        if multiple:
+            return lambda image: detector.detect_all(image) or None
+        return lambda image: detector.detect(image)
+
+    def start_capture(self):
+        self.video_service_subscribe()
+        self.set_face_tracking(True)    # If should be on by default, but it re-enables is for debugging purposes
+
+    def stop_capture(self):
         #self.set_face_tracking(False)
         self.video_service_unsubscribe()
-        return face_frames
+
+    # Blinking effect on face detection. It does not wait for the LEDs
+    def face_detected_feedback(self):
+        self.side_effects.submit(self.set_led_color, "green", speed=0.2)
+        self.side_effects.submit(self.set_led_color, "white", speed=0.2)
+
+    def undetected_feedback(self, undetected_frames):
+        if undetected_frames % 10 == 0:
+            self.say("I can't see you well. Can you please move closer?")
+
+    # Captures a certain amount of face frames
+    def collect_face_frames(self, number):
+        return list(self.face_frames(number))
 
     # Obtains training samples of one of the informers
     # Automatically updates the informant number
-    # Saves the frames in the captures directory
+    # Archives the frames in the capture session
     def acquire_examples(self, number_of_frames, informant_number):
         self.say("Hello informer number " + str(informant_number) + ". Please look at me")
         frames = self.collect_face_frames(number_of_frames)
         self.say("Thank you")
-        count = 1
         for frame in frames:
-            self.training_data.images.append(frame)
-            self.training_data.labels.append(informant_number)
-            cv2.imwrite("captures\\" + str(informant_number) + "-" + str(count) + ".jpg", frame)
-            count += 1
+            self.training_data.append(frame, informant_number)
+            self.capture_archive.add(frame, informant_number)
         self.informants += 1
         self.look_forward()
 
+    # Obtains training samples of a group of informers at once, sitting side by side in front of the robot.
+    # Faces are assigned from left to right to the informant numbers
+    def acquire_group_examples(self, number_of_frames, informant_numbers):
+        self.say("Hello informers. Please all look at me")
+        groups = list(self.face_frames(number_of_frames, group=len(informant_numbers)))
+        self.say("Thank you")
+        for faces in groups:
+            for informant_number, (rect, frame) in zip(informant_numbers, faces):
+                self.training_data.append(frame, informant_number)
+                self.capture_archive.add(frame, informant_number)
+        self.informants += len(informant_numbers)
+        self.look_forward()
+
     # Finalizes learning by training the model with all the data acquired
     def face_learning(self):
         recognition_train(self.training_data.prepare_for_training())
 
     # Recognizes a face
-    # Collects an amount of frames, gets a prediction on each of them and returns the most predicted label
-    def face_recognition(self, number_of_frames=5, announce=True):
+    # Each frame is predicted as soon as it is collected and gives a confidence-weighted vote to its label. Recognition
+    # stops when the leading label (possibly the unknown informant) is ahead by margin, or after number_of_frames frames.
+    # With sequential=False all the frames are always collected
+    def face_recognition(self, number_of_frames=5, announce=True, sequential=True, margin=RECOGNITION_MARGIN):
         unknown = False
         self.say("Please look at me")
-        # Collect face data
-        frames = self.collect_face_frames(number_of_frames)
-        # Counts the recognized labels
-        predictions = [0 for i in range(self.informants+1)]  # An extra slot to consider the -1 (unknown informant) case
-        for frame in frames:
-            predictions[recognition_predict(frame)] += 1
-        # Returns the maximum
-        guess = predictions.index(max(predictions))
-        # If the maximum value found is in the last position of the list, it's an unrecognized informant
-        if guess == len(predictions)-1:
+        frames = []
+        votes = SequentialVote()
+        for frame in self.face_frames(number_of_frames):
+            frames.append(frame)
+            predicted_label, predicted_confidence = recognition_predict_confidence(frame)
+            votes.add(predicted_label, predicted_confidence)
+            if sequential and votes.decided(margin):
+                break
+        guess = votes.leader()[0]
+        # Unrecognized informant
+        if guess < 0:
             unknown = True
+            # The model of the new informant is trained on all the frames, even if the decision came earlier
+            if len(frames) < number_of_frames:
+                frames += self.collect_face_frames(number_of_frames - len(frames))
             # Unknown informant! Adding it to the known ones and generating episodic memory
             self.manage_unknown_informant(frames)
             # This new informant has the biggest label yet
@@ -226,17 +299,31 @@ class Robot:
                 self.say("I've never seen you before, I'll call you informer " + str(guess))
         return guess
 
+    # Recognizes every informant visible at once. The faces of each frame are predicted in a batch
+    # Returns the vote map: label -> confidence-weighted votes over the frames. Unknown faces are all voted as -1, as
+    # they cannot be told apart: they are not added to the known informants
+    def group_recognition(self, number_of_frames=5):
+        votes = SequentialVote()
+        for faces in self.face_frames(number_of_frames, group=0):
+            for predicted_label, predicted_confidence in recognition_predict_batch([roi for rect, roi in faces]):
+                votes.add(predicted_label, predicted_confidence)
+        return votes.votes
+
     # Manages the unknown informant detection
     def manage_unknown_informant(self, frames):
         # Updates the model with the acquired frames and the right label
-        new_data = TrainingData()
-        new_data.images = frames
-        new_data.labels = [self.informants for i in range(len(frames))]
+        new_data = TrainingData(capacity=len(frames))
+        new_data.extend(frames, [self.informants] * len(frames))
         recognition_update(new_data.prepare_for_training())
-        # Creates an episodic belief network
+        self.add_episodic_belief()
+
+    # Creates the episodic belief network of a new informant
+    def add_episodic_belief(self):
         name = "Informer" + str(self.informants) + "_episodic"
         episodic_network = BeliefNetwork.create_episodic(self.beliefs, self.get_and_inc_time(), name=name)
         self.beliefs.append(episodic_network)
+        if self.episode_log is not None:
+            self.episode_log.extend(name, episodic_network.get_episode_dataset())
         # Updates the total of known informants
         self.informants += 1    # This is done at the end because the label for the class is actually self.informants-1
 
@@ -392,20 +479,19 @@ class Robot:
 
     # Load time value from file
     def load_time(self):
-        if os.path.isfile("current_time.csv"):
-            with open("current_time.csv", 'r') as f:
-                self.time = int(f.readline())
-        else:
-            self.time = 0
+        self.clock = LogicalClock()
+        self.time = self.clock.peek()
 
-    # Increases and saves the current time value
+    # Increases the current time value. The clock leases blocks of values, so the file is not rewritten on every call
     def get_and_inc_time(self):
-        previous_time = self.time
-        self.time += 1
-        with open("current_time.csv", 'w') as f:
-            f.write(str(self.time))
+        previous_time = self.clock.tick()
+        self.time = previous_time + 1
         return previous_time
 
+    # Gives the unused time values back to the clock file, when the session ends cleanly
+    def save_time(self):
+        self.clock.flush()
+
     # Saves the beliefs
     def save_beliefs(self):
         if not os.path.exists(".\\datasets"):
@@ -413,18 +499,44 @@ class Robot:
         for belief in self.beliefs:
             belief.save()
 
+    # Appends an episode of an informant to the episode log, as soon as it happens
+    def record_episode(self, name, episode):
+        if self.episode_log is not None:
+            self.episode_log.append(name, episode)
+
     # Loads the beliefs
+    # The binary episode log is preferred, if present, otherwise the CSV files are parsed in background.
+    # Beliefs are lazy proxies: each network is built the first time it is queried. Only the most recently used networks
+    # stay in memory, see InformantRegistry
     def load_beliefs(self, path=".\\datasets\\"):
         # Resets previous beliefs
-        self.beliefs = []
-        i = 0
-        while os.path.isfile(path + "Informer" + str(i) + ".csv"):
-            self.beliefs.append(BeliefNetwork("Informer" + str(i), path + "Informer" + str(i) + ".csv"))
-            i += 1
+        self.population = None
+        self.episode_log = EpisodeLog(path)
+        if self.episode_log.exists():
+            self.beliefs.reset([LazyBeliefNetwork(name, dataset)
+                                for name, dataset in zip(self.episode_log.informants(), self.episode_log.datasets())])
+        else:
+            self.beliefs.reset(BeliefLoader(path).load_beliefs())
+
+    # Returns the population of all the known informants, attaching the beliefs acquired since the last call
+    def get_population(self):
+        if self.population is None:
+            self.population = TrustPopulation(capacity=max(len(self.beliefs), 1))
+        # Each network is attached as soon as it is accessed: accessing the next ones may evict it, and only the networks
+        # bound to a row are bound again on reload
+        for label in range(self.population.size, len(self.beliefs)):
+            self.population.add(self.beliefs[label])
+        return self.population
+
+    # Saves the whole state of the robot (clock, beliefs, face model and training samples) in a single file
+    def snapshot(self, filename=SNAPSHOT_FILE):
+        save_snapshot(self, filename)
+
+    # Restores a state saved by snapshot, without parsing the datasets or retraining the face model
+    def restore(self, filename=SNAPSHOT_FILE):
+        load_snapshot(self, filename)
 
     # Reset time
     def reset_time(self):
-        if os.path.isfile("current_time.csv"):
-            with open("current_time.csv", 'w') as f:
-                f.write("0")
+        self.clock.reset()
         self.time = 0
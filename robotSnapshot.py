@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+
+from bayesianNetwork import BeliefNetwork
+from containerFile import read_container, replace_file, write_container
+from episodeDataset import EpisodeDataset
+from faceRecognition import MODEL_FILE, get_recognizer
+from informantRegistry import InformantRegistry
+from trainingData import TrainingData
+
+"""
+Single-file snapshot of the state of a robot: logical clock, count tables and episodes of every belief, informant labels,
+face recognition model (stored samples, or the YAML model file of older versions) and face training samples. Restored
+samples are not a trained model: the OpenCV recognizers are trained on them again when first used, see RecognizerService.
+The file is a versioned container (see containerFile) whose arrays are memory-mapped on restore.
+"""
+
+SNAPSHOT_FILE = "robot_state.snap"
+MAGIC = "VBSNAP"
+FORMAT_VERSION = 1
+
+
+# Saves the state of a robot
+def save_snapshot(robot, filename=SNAPSHOT_FILE):
+    beliefs = robot.beliefs
+    counts = [belief.dataset.get_counts() for belief in beliefs]
+    datasets = [belief.get_episode_dataset() for belief in beliefs]
+    arrays = dict()
+    for table in ["Xi", "Xr", "Yi", "Yr", "pdf_counts"]:
+        arrays[table] = np.array([belief_counts[table] for belief_counts in counts], dtype=float)
+    arrays["episode_codes"] = np.concatenate([dataset.codes for dataset in datasets] + [np.zeros(0, np.uint8)])
+    arrays["episode_times"] = np.concatenate([dataset.times for dataset in datasets] + [np.zeros(0, np.int64)])
+    arrays["episode_bounds"] = np.cumsum([0] + [len(dataset) for dataset in datasets]).astype(np.int64)
+    # The face model is written in background: waits for the last training or update
+    recognizer = get_recognizer()
+    recognizer.flush()
+    if recognizer.store.exists():
+        arrays["face_images"], arrays["face_labels"], histograms = recognizer.store.load()
+        if histograms is not None:
+            arrays["face_histograms"] = histograms
+    elif os.path.isfile(MODEL_FILE):
+        with open(MODEL_FILE, 'rb') as f:
+            arrays["face_model"] = np.frombuffer(f.read(), dtype=np.uint8)
+    if robot.training_data is not None and len(robot.training_data.images) > 0:
+        arrays["training_images"] = np.asarray(robot.training_data.images, dtype=np.uint8)
+        arrays["training_labels"] = np.asarray(robot.training_data.labels, dtype=np.int32)
+    metadata = {
+        "time": int(robot.clock.peek()) if robot.clock is not None else int(robot.time),
+        "informants": robot.informants,
+        "names": [belief.name for belief in beliefs],
+        "half_life": [belief.half_life for belief in beliefs],
+        "window": [belief.window for belief in beliefs],
+        "reference_time": [None if c["reference_time"] is None else int(c["reference_time"]) for c in counts]
+    }
+    write_container(filename, metadata, arrays, MAGIC, FORMAT_VERSION)
+
+
+# Restores the state of a robot saved by save_snapshot
+def load_snapshot(robot, filename=SNAPSHOT_FILE):
+    metadata, arrays = read_container(filename, MAGIC, FORMAT_VERSION)
+    bounds = arrays["episode_bounds"]
+    beliefs = []
+    for i, name in enumerate(metadata["names"]):
+        dataset = EpisodeDataset(arrays["episode_codes"][bounds[i]:bounds[i + 1]],
+                                 arrays["episode_times"][bounds[i]:bounds[i + 1]])
+        counts = dict((table, arrays[table][i]) for table in ["Xi", "Xr", "Yi", "Yr", "pdf_counts"])
+        counts["reference_time"] = metadata["reference_time"][i]
+        beliefs.append(BeliefNetwork(name, dataset, half_life=metadata["half_life"][i], window=metadata["window"][i],
+                                     counts=counts))
+    if isinstance(robot.beliefs, InformantRegistry):
+        robot.beliefs.reset(beliefs)
+    else:
+        robot.beliefs = beliefs
+    robot.population = None
+    robot.informants = metadata["informants"]
+    # The clock never goes backwards, as other sessions may have used it in the meantime
+    if robot.clock is not None:
+        robot.clock.advance(metadata["time"])
+        robot.time = robot.clock.peek()
+    else:
+        robot.time = metadata["time"]
+    recognizer = get_recognizer()
+    recognizer.flush()
+    if "face_images" in arrays:
+        recognizer.store.reset(arrays["face_images"], arrays["face_labels"], arrays.get("face_histograms"))
+        recognizer.reload()
+    elif "face_model" in arrays:
+        if restore_file(MODEL_FILE, arrays["face_model"]):
+            recognizer.reload()
+    if robot.training_data is None:
+        robot.training_data = TrainingData()
+    robot.training_data.clear()
+    if "training_images" in arrays:
+        robot.training_data.extend(arrays["training_images"], arrays["training_labels"])
+
+
+# Writes the content of a file, only if it differs from the current one. Returns True if the file has been written
+def restore_file(filename, content):
+    content = content.tobytes()
+    if os.path.isfile(filename) and os.path.getsize(filename) == len(content):
+        with open(filename, 'rb') as f:
+            if f.read() == content:
+                return False
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(filename + ".tmp", 'wb') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    replace_file(filename + ".tmp", filename)
+    return True
@@ -1,4 +1,9 @@
+from captureArchive import CaptureArchive
+from episodeLog import EpisodeLog
+from faceDetection import FaceDetector
+from facePipeline import DETECTION_WORKERS, SideEffects
 from faceRecognition import *
+from informantRegistry import InformantRegistry
 from robot import Robot
 import numpy as np
 
@@ -15,10 +20,19 @@ class SimulatedRobot(Robot):
         # This class doesn't call it's superclass initializer because it can't connect a session and retrieve services
         self.IP = 'pepper.local'
         self.PORT = 9559
+        # Detected faces are drawn on the debug screen
+        self.face_detector = FaceDetector(annotate=True)
+        self.detection_workers = DETECTION_WORKERS
+        self.side_effects = SideEffects()
+        self.capture_statistics = None
         self.training_data = TrainingData()
+        self.capture_archive = CaptureArchive()
         self.informants = 0
-        self.beliefs = []
+        self.beliefs = InformantRegistry()
+        self.population = None
+        self.episode_log = EpisodeLog()
         self.time = None
+        self.clock = None
         self.load_time()
         # Adds the landmark position to the simulation
         self.landmark_position = 'A'
@@ -65,22 +79,19 @@ class SimulatedRobot(Robot):
         else:
             return None
 
-    # Includes a visual debug screen
-    def collect_face_frames(self, number):
-        face_frames = []
-        found_faces = 0
-        while found_faces < number:
-            image = self.get_camera_image()
-            detected, roi = self.detect_face(image, grayscale=True)
-            if detected:
-                found_faces += 1
-                face_frames.append(roi)
-            cv2.putText(image, str("Detected: " + str(found_faces) + " / " + str(number)),
-                        (0, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
-            cv2.imshow("Robot Eyes", image)
-            cv2.waitKey(1)
+    # Capture hooks of face_frames: there is no video service to subscribe, LEDs or speech. Includes a visual debug
+    # screen
+    def start_capture(self):
+        pass
+
+    def stop_capture(self):
         cv2.destroyAllWindows()
-        return face_frames
+
+    def face_detected_feedback(self):
+        pass
+
+    def undetected_feedback(self, undetected_frames):
+        pass
 
     # Input: A or B
     def look_for_landmark(self, side):
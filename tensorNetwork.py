@@ -0,0 +1,76 @@
+import numpy as np
+
+"""
+Exact inference engine specialized for the four binary nodes of the Bayesian Model of Trust.
+The conditional probability tables are stored as NumPy arrays and every query is answered by contracting the joint
+probability tensor, instead of building and propagating a junction tree.
+All the functions accept parameters stacked along leading axes, so that many networks can be queried at once.
+"""
+
+# Nodes of the network, in the order of the axes of the joint probability tensor
+NODES = ['informant_belief', 'robot_belief', 'informant_action', 'robot_action']
+# Values of every node, in the order of the axes of each table
+DOMAIN = ['A', 'B']
+
+
+# Translates the parameters estimated by DatasetParser in a joint probability tensor of shape (..., 2, 2, 2, 2).
+# The layout mirrors the factor functions of BeliefNetwork: Xi and Xr store the value 'A' at index 1, while Yi and Yr
+# store it at index 0.
+def joint_tensor(Xi, Xr, Yi, Yr):
+    Xi = np.asarray(Xi, dtype=float)[..., ::-1]
+    Xr = np.asarray(Xr, dtype=float)[..., ::-1]
+    Yi = np.asarray(Yi, dtype=float)
+    Yr = np.asarray(Yr, dtype=float)
+    # Yr rows are indexed by (informant_action, robot_belief)
+    Yr = Yr.reshape(Yr.shape[:-2] + (2, 2, 2))
+    return np.einsum('...i,...r,...ia,...ary->...iray', Xi, Xr, Yi, Yr)
+
+
+# Computes the posterior marginals of every node given some evidence, as a (..., 4, 2) array ordered as NODES and DOMAIN
+# Evidence values can be a single 'A' / 'B' or an array of them, one for each stacked network.
+def marginals(joint, **evidence):
+    for node, value in evidence.items():
+        axis = NODES.index(node) - len(NODES)
+        mask = np.asarray(value) == 'A'
+        mask = np.stack([mask, ~mask], axis=-1).astype(float)
+        # Brings the mask's value axis in the position of the evidence node
+        shape = mask.shape[:-1] + (1,) * (len(NODES) + axis) + (2,) + (1,) * (-axis - 1)
+        joint = joint * mask.reshape(shape)
+    total = joint.sum(axis=(-4, -3, -2, -1))[..., np.newaxis]
+    output = np.empty(joint.shape[:-4] + (len(NODES), len(DOMAIN)))
+    output[..., 0, :] = joint.sum(axis=(-3, -2, -1))
+    output[..., 1, :] = joint.sum(axis=(-4, -2, -1))
+    output[..., 2, :] = joint.sum(axis=(-4, -3, -1))
+    output[..., 3, :] = joint.sum(axis=(-4, -3, -2))
+    return output / total[..., np.newaxis]
+
+
+class TensorNetwork:
+    def __init__(self, parameters, name=None):
+        self.name = name
+        self.joint = None
+        self.set_parameters(parameters)
+
+    # Rebuilds the joint probability tensor from a new set of parameters
+    def set_parameters(self, parameters):
+        self.joint = joint_tensor(parameters["Xi"], parameters["Xr"], parameters["Yi"], parameters["Yr"])
+
+    # Queries the network. Output has the same format of bayesian.bbn: a dictionary indexed by (node, value)
+    def query(self, **kwds):
+        output = marginals(self.joint, **kwds)
+        result = dict()
+        for i, node in enumerate(NODES):
+            for j, value in enumerate(DOMAIN):
+                result[node, value] = output[i][j]
+        return result
+
+    # Prints the result of a query as a table
+    def q(self, **kwds):
+        result = self.query(**kwds)
+        print "+" + "-" * 18 + "+" + "-" * 7 + "+" + "-" * 10 + "+"
+        print "| {0:<16} | {1:<5} | {2:<8} |".format("Node", "Value", "Marginal")
+        print "+" + "-" * 18 + "+" + "-" * 7 + "+" + "-" * 10 + "+"
+        for node in NODES:
+            for value in DOMAIN:
+                print "| {0:<16} | {1:<5} | {2:8.6f} |".format(node, value, result[node, value])
+        print "+" + "-" * 18 + "+" + "-" * 7 + "+" + "-" * 10 + "+"
@@ -0,0 +1,65 @@
+import os
+import sys
+import threading
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from faceRecognition import RecognizerService
+from trainingData import TrainingData
+
+"""
+Tests of the background writer of RecognizerService.
+
+Usage:  python -m unittest discover tests
+"""
+
+
+# Face model store whose writes always fail, e.g. on a full disk
+class FailingStore(object):
+    def __init__(self):
+        self.calls = 0
+
+    def exists(self):
+        return False
+
+    def reset(self, images, labels, histograms=None):
+        self.calls += 1
+        raise IOError("No space left on device")
+
+    def append(self, images, labels, histograms=None):
+        self.calls += 1
+        raise IOError("No space left on device")
+
+
+def random_faces(count, label, seed):
+    data = TrainingData()
+    data.extend(np.random.RandomState(seed).randint(0, 256, (count, 64, 64)).astype(np.uint8), [label] * count)
+    return data
+
+
+class RecognizerWriterTest(unittest.TestCase):
+    # Waits for flush in another thread, so that a hanging writer fails the test instead of blocking it
+    def assertFlushReturns(self, service, timeout=5.0):
+        flusher = threading.Thread(target=service.flush)
+        flusher.daemon = True
+        flusher.start()
+        flusher.join(timeout)
+        self.assertFalse(flusher.is_alive(), "flush() did not return")
+
+    def test_flush_returns_after_store_failure(self):
+        store = FailingStore()
+        service = RecognizerService(model_file=os.devnull + ".yml", algorithm=3, store=store)
+        service.train(random_faces(3, 0, 0).prepare_for_training())
+        self.assertFlushReturns(service)
+        # The writer is still alive and serves the next operations
+        service.update(random_faces(3, 1, 1).prepare_for_training())
+        self.assertFlushReturns(service)
+        self.assertEqual(store.calls, 2)
+        self.assertEqual(service.predict(random_faces(1, 1, 1).images[0])[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
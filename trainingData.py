@@ -1,22 +1,131 @@
+import os
+
+import cv2
 import numpy as np
 
 """
 Support class to manage the training dataset for the face recognition algorithms.
+The samples are stored in one contiguous (N, 64, 64) uint8 array with a parallel int32 array of labels, so they are
+handed to the recognizer without copying them. Grayscale images of other sizes are scaled to the sample size. The arrays
+grow by doubling their capacity; with a file name, the samples live in a memory-mapped file instead of RAM. The file
+only spills the samples out of RAM and is not a persistent store: it is overwritten by every new TrainingData, and the
+labels are kept in RAM. Samples are saved with the state snapshots (see robotSnapshot).
 """
 
+# Side of the square face samples, as the regions of interest of faceDetection
+SAMPLE_SIZE = 64
+CAPACITY = 64
+# Memory-mapped file of the samples collected by the robot, rewritten at every start
+SAMPLES_FILE = ".\\datasets\\training_samples.bin"
+
+
+class TrainingData(object):
+    def __init__(self, capacity=CAPACITY, filename=None, size=SAMPLE_SIZE):
+        self.filename = filename
+        self.size = size
+        self.count = 0
+        self.buffer = self.allocate(max(capacity, 1))
+        self.label_buffer = np.zeros(len(self.buffer), dtype=np.int32)
+
+    # New sample array of some capacity, in RAM or in the memory-mapped file
+    def allocate(self, capacity):
+        shape = (capacity, self.size, self.size)
+        if self.filename is None:
+            return np.zeros(shape, dtype=np.uint8)
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # A new file, overwriting the one of a previous session, or the current one enlarged by numpy keeping the
+        # samples already written
+        mode = 'r+' if os.path.isfile(self.filename) and self.count > 0 else 'w+'
+        return np.memmap(self.filename, dtype=np.uint8, mode=mode, shape=shape)
+
+    def __len__(self):
+        return self.count
+
+    # Samples and labels, as views of the stored ones
+    @property
+    def images(self):
+        return self.buffer[:self.count]
+
+    @images.setter
+    def images(self, images):
+        self.count = 0
+        self.extend(images, np.zeros(len(images), dtype=np.int32))
+
+    @property
+    def labels(self):
+        return self.label_buffer[:self.count]
 
-class TrainingData:
-    def __init__(self):
-        self.images = []
-        self.labels = []
+    @labels.setter
+    def labels(self, labels):
+        self.label_buffer[:self.count] = labels
+
+    # Makes room for some samples. The capacity is at least doubled, so appends take amortized constant time
+    def reserve(self, capacity):
+        if capacity <= len(self.buffer):
+            return
+        capacity = max(capacity, 2 * len(self.buffer))
+        if self.filename is None:
+            buffer = self.allocate(capacity)
+            buffer[:self.count] = self.buffer[:self.count]
+        else:
+            self.buffer.flush()
+            self.buffer = None
+            buffer = self.allocate(capacity)
+        labels = np.zeros(capacity, dtype=np.int32)
+        labels[:self.count] = self.label_buffer[:self.count]
+        self.buffer = buffer
+        self.label_buffer = labels
+
+    # Adds a face sample
+    def append(self, image, label):
+        self.reserve(self.count + 1)
+        self.buffer[self.count] = self.fit(image)
+        self.label_buffer[self.count] = label
+        self.count += 1
+
+    # Adds some face samples, e.g. all the frames of an informant
+    def extend(self, images, labels):
+        labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+        self.reserve(self.count + len(labels))
+        if isinstance(images, np.ndarray) and images.shape[1:] == self.buffer.shape[1:]:
+            self.buffer[self.count:self.count + len(labels)] = images
+        else:
+            for i in range(len(labels)):
+                self.buffer[self.count + i] = self.fit(images[i])
+        self.label_buffer[self.count:self.count + len(labels)] = labels
+        self.count += len(labels)
+
+    # A grayscale image as a sample: scaled if its size is different
+    def fit(self, image):
+        image = np.asarray(image, dtype=np.uint8)
+        if image.ndim != 2:
+            print "[ERROR] TrainingData: face samples must be grayscale images, got shape " + str(image.shape)
+            quit(-1)
+        if image.shape != (self.size, self.size):
+            image = cv2.resize(image, (self.size, self.size), interpolation=cv2.INTER_AREA)
+        return image
+
+    # Samples of an informant
+    def informant(self, label):
+        return self.images[self.labels == label]
+
+    # Empties the store, keeping its capacity
+    def clear(self):
+        self.count = 0
+
+    # A TrainingData in RAM with a copy of the samples and labels, made with one copy of the whole arrays
+    def copy(self):
+        new_item = TrainingData(capacity=self.count, size=self.size)
+        new_item.extend(self.images, self.labels)
+        return new_item
 
-    # Converts images from OpenCV image to nparray and generates a new TrainingData object to be passed
-    # to the training function
+    # Generates a new TrainingData object to be passed to the training function. Its samples and labels are views of
+    # these ones: no image is copied, so they change if this store is cleared or refilled
     def prepare_for_training(self):
-        nparrays = []
-        for image in self.images:
-            nparrays.append(np.asarray(image, dtype=np.uint8))
-        new_item = TrainingData()
-        new_item.images = nparrays
-        new_item.labels = np.asarray(self.labels, dtype=np.int32)
+        new_item = TrainingData(capacity=1, size=self.size)
+        new_item.buffer = self.images
+        new_item.label_buffer = self.labels
+        new_item.count = self.count
         return new_item
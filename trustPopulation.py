@@ -0,0 +1,172 @@
+import numpy as np
+
+from tensorNetwork import joint_tensor, marginals, NODES
+
+"""
+This class stores the count tables of a whole population of informants as stacked NumPy arrays, so that decision making,
+belief estimation and reliability can be evaluated for every informant with a single vectorized call.
+The DatasetParser of each attached BeliefNetwork is rebound to a row of these arrays, so that the network acts as a view:
+its real-time updates are immediately visible to the population and vice versa.
+"""
+
+
+# Picks 'A' where the first probability is the highest, 'B' otherwise. Ties are broken at random
+def pick_side(p_a, p_b):
+    ties = p_a == p_b
+    random_sides = np.where(np.random.randint(0, 2, size=np.shape(p_a)) == 1, 'A', 'B')
+    return np.where(ties, random_sides, np.where(p_a > p_b, 'A', 'B'))
+
+
+class TrustPopulation:
+    def __init__(self, capacity=16):
+        self.size = 0
+        self.names = []
+        self.members = []   # Attached DatasetParser instances, one for each row
+        # Initializations at 1 to avoid dividing for zero, as in DatasetParser
+        self.Xi = np.ones((capacity, 2))
+        self.Xr = np.ones((capacity, 2))
+        self.Yi = np.ones((capacity, 2, 2))
+        self.Yr = np.ones((capacity, 4, 2))
+        self.pdf_counts = np.ones((capacity, 4))
+
+    # Builds a population from a list of BeliefNetwork, which become views of it
+    @staticmethod
+    def from_beliefs(bn_list):
+        population = TrustPopulation(capacity=max(len(bn_list), 1))
+        for bn in bn_list:
+            population.add(bn)
+        return population
+
+    # Adds a BeliefNetwork to the population and returns its row index
+    def add(self, bn):
+        if self.size == len(self.Xi):
+            self.grow(2 * self.size)
+        index = self.size
+        self.size += 1
+        self.names.append(bn.name)
+        self.members.append(None)
+        self.bind(bn.dataset, index)
+        return index
+
+    # Copies the counts of a DatasetParser in a row of the population and rebinds the parser to it
+    def bind(self, parser, index):
+        if not parser.counted:
+            parser.read_dataset()
+        self.Xi[index] = parser.Xi
+        self.Xr[index] = parser.Xr
+        self.Yi[index] = parser.Yi
+        self.Yr[index] = parser.Yr
+        self.pdf_counts[index] = parser.pdf_counts
+        self.members[index] = parser
+        self.rebind(index)
+
+    # Points the count tables of a member to its row. Needed every time the arrays are reallocated
+    def rebind(self, index):
+        parser = self.members[index]
+        parser.Xi = self.Xi[index]
+        parser.Xr = self.Xr[index]
+        parser.Yi = self.Yi[index]
+        parser.Yr = self.Yr[index]
+        parser.pdf_counts = self.pdf_counts[index]
+        parser.population = self
+        parser.population_index = index
+
+    # Detaches the member of a row, e.g. when its network is evicted from memory. The row keeps its counts
+    def release(self, index):
+        parser = self.members[index]
+        if parser is not None:
+            parser.Xi = self.Xi[index].copy()
+            parser.Xr = self.Xr[index].copy()
+            parser.Yi = self.Yi[index].copy()
+            parser.Yr = self.Yr[index].copy()
+            parser.pdf_counts = self.pdf_counts[index].copy()
+            parser.population = None
+            parser.population_index = None
+        self.members[index] = None
+
+    # Enlarges the arrays to a new capacity, keeping the members attached
+    def grow(self, capacity):
+        capacity = max(capacity, 1)
+        for attribute in ["Xi", "Xr", "Yi", "Yr", "pdf_counts"]:
+            old = getattr(self, attribute)
+            new = np.ones((capacity,) + old.shape[1:])
+            new[:self.size] = old[:self.size]
+            setattr(self, attribute, new)
+        for index in range(self.size):
+            if self.members[index] is not None:
+                self.rebind(index)
+
+    # Index of an informant given the name of its network
+    def index_of(self, name):
+        return self.names.index(name)
+
+    # Maximum likelihood parameters of every informant, as stacked arrays
+    def estimate_parameters(self):
+        n = self.size
+        return {
+            "Xr": self.Xr[:n] / self.Xr[:n].sum(axis=-1, keepdims=True),
+            "Yr": self.Yr[:n] / self.Yr[:n].sum(axis=-1, keepdims=True),
+            "Xi": self.Xi[:n] / self.Xi[:n].sum(axis=-1, keepdims=True),
+            "Yi": self.Yi[:n] / self.Yi[:n].sum(axis=-1, keepdims=True)
+        }
+
+    # Joint probability tensor of every informant, shape (N, 2, 2, 2, 2)
+    def joint(self):
+        parameters = self.estimate_parameters()
+        return joint_tensor(parameters["Xi"], parameters["Xr"], parameters["Yi"], parameters["Yr"])
+
+    # Decision Making for all the informants at once. hints contains one 'A' or 'B' for each informant
+    # Returns an array of the sides chosen by the robot, None where the hint is invalid
+    def decision_making(self, hints):
+        hints = np.asarray(hints)
+        valid = (hints == 'A') | (hints == 'B')
+        outputs = marginals(self.joint(), informant_action=np.where(valid, hints, 'A'))
+        robot_action = outputs[:, NODES.index('robot_action')]
+        choices = pick_side(robot_action[:, 0], robot_action[:, 1]).astype(object)
+        choices[~valid] = None
+        return choices
+
+    # Belief Estimation for all the informants at once. sides contains the sticker position known by the robot
+    # Returns a (N, 2) array of predicted [informant_belief, informant_action], None where the side is invalid
+    def belief_estimation(self, sides):
+        sides = np.asarray(sides)
+        valid = (sides == 'A') | (sides == 'B')
+        sides = np.where(valid, sides, 'A')
+        outputs = marginals(self.joint(), robot_belief=sides, robot_action=sides)
+        informant_belief = outputs[:, NODES.index('informant_belief')]
+        informant_action = outputs[:, NODES.index('informant_action')]
+        predicted_behaviour = np.stack([pick_side(informant_belief[:, 0], informant_belief[:, 1]),
+                                        pick_side(informant_action[:, 0], informant_action[:, 1])],
+                                       axis=1).astype(object)
+        predicted_behaviour[~valid] = None
+        return predicted_behaviour
+
+    # Reliability of every informant as a real value between -1 and +1, as in BeliefNetwork.get_reliability
+    def get_reliability(self):
+        outputs = marginals(self.joint(), robot_belief='A', robot_action='A')
+        x = outputs[:, NODES.index('informant_action'), 0]
+        # Scale it to [-1, +1]
+        a = -1
+        b = 1
+        min = 0.25
+        max = 0.75
+        return ((b - a) * (x - min)) / (max - min) + a
+
+    # Indexes of the k most trustworthy informants, from the most reliable one
+    def most_trustworthy(self, k=1):
+        return self.rank(k, most=True)
+
+    # Indexes of the k least trustworthy informants, from the least reliable one
+    def least_trustworthy(self, k=1):
+        return self.rank(k, most=False)
+
+    # Top-k selection over the reliabilities, without sorting the whole population
+    def rank(self, k, most=True):
+        reliability = self.get_reliability()
+        if not most:
+            reliability = -reliability
+        k = min(k, self.size)
+        if k <= 0:
+            return np.array([], dtype=int)
+        top = np.argpartition(-reliability, k - 1)[:k]
+        return top[np.argsort(-reliability[top])]